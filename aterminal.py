@@ -0,0 +1,264 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# aterminal.py     asyncio variant of the Bt3 serial port model
+#
+# AsyncTerminal registers the port file descriptor with the event loop
+# instead of running a listener thread. Received chunks are taken with
+# 'async for', a full receive queue pauses reading so a slow consumer
+# pushes back on the port. TerminalBridge runs an AsyncTerminal on a loop
+# thread of its own and offers the blocking Terminal interface the Tk
+# front end uses. Needs an event loop with add_reader(), i.e. POSIX.
+#
+
+import os
+import queue
+import asyncio
+import threading
+import concurrent.futures
+
+
+from terminal import Terminal
+
+
+class AsyncTerminal(Terminal):
+  """AsyncTerminal - Terminal driven by an asyncio event loop.
+
+     settings, options, checksum, CR/LF, echo, status and capture work
+     as in Terminal. connect(), disconnect() and talk() are coroutines.
+  """
+  threaded_tx = False          # send() writes from the event loop
+
+  def __init__(self, maxsize=256):
+    Terminal.__init__(self)
+    self.rxQ = asyncio.Queue(maxsize)   # receive queue, bounded for backpressure
+    self.paused = False                 # reading paused while rxQ is full
+    self.loop = None
+    self.wlock = None                   # held while a frame is written
+    self.rest = None                    # task writing the rest of a response, see respond()
+
+  async def connect(self):
+    self.loop = asyncio.get_running_loop()
+    self.wlock = asyncio.Lock()
+    if Terminal.connect(self, self):
+      self.loop.add_reader(self.fileno(), self._on_readable)
+    return self.connected
+
+  async def disconnect(self):
+    Terminal.disconnect(self)
+
+  async def talk(self, line):
+    if self.connected:
+      await self.send(self.frame(line))
+    else:
+      self.status.set('Not connected.')
+
+  async def talk_entry(self, entry, block=False):
+    if self.connected:
+      await self.send(self.compile(entry))
+    else:
+      self.status.set('Not connected.')
+
+  async def send(self, b):
+    async with self.wlock:     # frames sent concurrently go out whole, in order
+      if self.rest:
+        await asyncio.wait([self.rest])
+      await self._write(b)
+    self._sent(b)
+
+  async def _write_rest(self, b, n):
+    # write b from n on, the first n bytes went out already. send() waits
+    # for it, so no other frame goes out before the rest.
+    try:
+      await self._write(b[n:])
+    finally:
+      self.rest = None
+    self._sent(b)
+
+  def respond(self, b):
+    # called by the responder on the loop, writes what the driver takes
+    # right away and leaves the rest to a task
+    if self.wlock.locked() or self.rest:
+      self.loop.create_task(self.send(b))
+      return
+    try:
+      n = os.write(self.fileno(), b)
+    except BlockingIOError:
+      n = 0
+    if n < len(b):
+      self.rest = self.loop.create_task(self._write_rest(b, n))
+    else:
+      self._sent(b)
+
+  async def _write(self, b):
+    # the port is non-blocking, wait for room when the driver is full
+    fd = self.fileno()
+    view = memoryview(b)
+    while view:
+      try:
+        view = view[os.write(fd, view):]
+      except BlockingIOError:
+        writable = self.loop.create_future()
+        self.loop.add_writer(fd, lambda: writable.done() or writable.set_result(None))
+        try:
+          await writable
+        finally:
+          self.loop.remove_writer(fd)
+
+  async def get(self):
+    """Return the next received (t_ns, bytes), bytes is b'' once disconnected."""
+    item = await self.rxQ.get()
+    if self.paused and self.connected and self.rxQ.qsize() < self.rxQ.maxsize // 2:
+      self.paused = False
+      self.loop.add_reader(self.fileno(), self._on_readable)
+    return item
+
+  def __aiter__(self):
+    return self
+
+  async def __anext__(self):
+    # the received chunks, without their time
+    while self.connected or not self.rxQ.empty():
+      _, bytes_val = await self.get()
+      if bytes_val:
+        return bytes_val
+    raise StopAsyncIteration
+
+  async def frames(self, framer):
+    """Iterate over the frames framer cuts from the received chunks."""
+    async for bytes_val in self:
+      for frame in framer.feed(bytes_val):
+        yield frame
+
+  # Terminal.connect() and disconnect() take the terminal itself as its
+  # selector, the event loop is the I/O thread here.
+  def add(self, term):
+    self._serial.timeout = 0
+
+  def remove(self, term):
+    self.loop.remove_reader(self.fileno())
+    if not self.rxQ.full():
+      self.rxQ.put_nowait((0, b''))   # wakes a consumer waiting in get()
+
+  def _received(self, data, t_ns):
+    self._tap(data, t_ns)
+    self.rxQ.put_nowait((t_ns, data))
+    if self.rxQ.full():
+      self.paused = True
+      self.loop.remove_reader(self.fileno())
+
+  def _on_readable(self):
+    # after a read error the port is done with, as if disconnected
+    if not self.receive():
+      self.remove(self)
+
+
+class TerminalBridge(object):
+  """TerminalBridge - Blocking Terminal interface to an AsyncTerminal.
+
+     Runs the event loop on a thread of its own and pumps received chunks
+     into a queue.Queue rxQ, so TermPresenter runs on top unchanged.
+     Attributes other than its own are those of the AsyncTerminal.
+     send() without block hands the frame to the loop and returns, up to
+     tx_limit frames may be in flight.
+  """
+  _own = ('aterm', 'loop', 'thd', 'rxQ', '_pump', 'tx_pending')
+  tx_limit = 64
+
+  def __init__(self, aterm=None):
+    object.__setattr__(self, 'aterm', aterm or AsyncTerminal())
+    object.__setattr__(self, 'rxQ', queue.Queue())
+    object.__setattr__(self, '_pump', None)
+    object.__setattr__(self, 'tx_pending', set())   # futures of frames sent without block
+    object.__setattr__(self, 'loop', asyncio.new_event_loop())
+    object.__setattr__(self, 'thd', threading.Thread(target=self.loop.run_forever))
+    self.thd.daemon = True
+    self.thd.start()
+
+  def __getattr__(self, name):
+    return getattr(self.aterm, name)
+
+  def __setattr__(self, name, value):
+    if name in self._own:
+      object.__setattr__(self, name, value)
+    else:
+      setattr(self.aterm, name, value)
+
+  def _run(self, coro):
+    return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+  async def _pump_rx(self):
+    while self.aterm.connected or not self.aterm.rxQ.empty():
+      item = await self.aterm.get()
+      if item[1]:
+        self.rxQ.put(item)
+
+  def connect(self):
+    connected = self._run(self.aterm.connect())
+    if connected:
+      self._pump = asyncio.run_coroutine_threadsafe(self._pump_rx(), self.loop)
+    return connected
+
+  def disconnect(self):
+    for future in list(self.tx_pending):
+      future.cancel()
+    self._run(self.aterm.disconnect())
+    if self._pump:
+      self._pump.result()
+      self._pump = None
+
+  def talk(self, line):
+    self._run(self.aterm.talk(line))
+
+  def talk_entry(self, entry, block=False):
+    self._run(self.aterm.talk_entry(entry))
+
+  def send(self, b, block=False, timeout=None):
+    # with block wait until b is written, up to timeout seconds, otherwise
+    # leave it to the loop, e.g. for the bridge thread which must not wait
+    # on the port. a frame not written within timeout is cancelled.
+    if block:
+      future = asyncio.run_coroutine_threadsafe(self.aterm.send(b), self.loop)
+      try:
+        future.result(timeout)
+      except concurrent.futures.TimeoutError:
+        future.cancel()
+        return False
+      return True
+    if self.tx_full():
+      self.status.set('TX queue full, frame dropped.')
+      return False
+    future = asyncio.run_coroutine_threadsafe(self.aterm.send(b), self.loop)
+    self.tx_pending.add(future)
+    future.add_done_callback(self._written)
+    return True
+
+  def _written(self, future):
+    self.tx_pending.discard(future)
+    if not future.cancelled() and future.exception():
+      self.status.set('Error while writing to %s:\n%s' % (self.settings['device'], str(future.exception())))
+
+  def tx_full(self):
+    return len(self.tx_pending) >= self.tx_limit
+
+  def close(self):
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self.thd.join()
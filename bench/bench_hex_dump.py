@@ -0,0 +1,75 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# bench_hex_dump.py     hexdump formatting throughput
+#
+# Compares the former per-byte hex_dump with the table driven hex_dump and
+# the streaming HexDumper over the same random payload, fed in chunks of
+# the sizes a listener typically reads.
+#
+# usage: python bench/bench_hex_dump.py [megabytes]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from support import achr, hex_dump, HexDumper
+
+
+def legacy_hex_dump(bytes_val):
+  # hex_dump as it was before, kept here as a reference point
+  hex_val = [bytes_val[i:i+16] for i in range(0, len(bytes_val), 16)]
+
+  cnt = 0
+  dump = []
+  for row in hex_val:
+    dump.append('%04X  %s%s\n' % (cnt, ''.join(['%02X '% x for x in row]).strip().ljust(56), ''.join([achr(c) for c in row])))
+    cnt = cnt + 16
+
+  return ''.join(dump)
+
+
+def run(func, chunks):
+  t0 = time.perf_counter()
+  for c in chunks:
+    func(c)
+  return time.perf_counter() - t0
+
+
+def main():
+  size = int(float(sys.argv[1] if len(sys.argv) > 1 else 4) * 1024 * 1024)
+  payload = os.urandom(size)
+
+  assert hex_dump(payload[:4096]) == legacy_hex_dump(payload[:4096])
+
+  print('%8s %12s %12s %12s' % ('chunk', 'legacy MB/s', 'table MB/s', 'stream MB/s'))
+  for chunk in (64, 1024, 16384):
+    chunks = [payload[i:i + chunk] for i in range(0, size, chunk)]
+    dumper = HexDumper()
+    rates = [size / run(f, chunks) / 1e6 for f in (legacy_hex_dump, hex_dump, dumper.feed)]
+    print('%8d %12.2f %12.2f %12.2f' % ((chunk,) + tuple(rates)))
+
+
+if __name__ == '__main__':
+  main()
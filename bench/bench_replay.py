@@ -0,0 +1,92 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# bench_replay.py     end-to-end rendering throughput
+#
+# Replays a payload through a pty loopback into Terminal and TermPresenter
+# with a headless view, once paced at a baud rate and once as fast as
+# possible, and reports how fast the presenter renders what arrives.
+#
+# usage: python bench/bench_replay.py [kilobytes] [baud] [workers]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from terminal import Terminal
+from bt3 import TermPresenter
+from replay import Loopback, Replayer
+from headless import HeadlessView, HeadlessInteractor
+
+
+def payload_stream(size, chunk, baud):
+  data = (b'The quick brown fox jumps over the lazy dog 0123456789\r\n' * (size // 56 + 1))[:size]
+  ns_per_byte = 10 * 10**9 // baud
+  for i in range(0, size, chunk):
+    yield i * ns_per_byte, data[i:i + chunk]
+
+
+def run(size, baud, speed, mode, workers=0):
+  loop = Loopback()
+  term = Terminal()
+  term.settings['device'] = loop.device
+  view = HeadlessView()
+  ui = HeadlessInteractor()
+  presenter = TermPresenter(term, view, ui)
+  view.view_var.set(mode)
+  if workers:
+    presenter.start_pool(workers)
+
+  def done():
+    # everything sent and the view idle for a while
+    return (rep.bytes == size and term.rxQ.empty() and not (presenter.pool and presenter.pool.pending()) and
+            view.last is not None and time.perf_counter() - view.last > 0.2)
+
+  term.connect()
+  rep = Replayer(payload_stream(size, 256, baud), loop.write, speed)
+  t0 = time.perf_counter()
+  rep.start()
+  ui.run_until(done)
+  rep.join()
+  term.disconnect()
+  presenter.stop_pool()
+  loop.close()
+  return view.last - t0, view
+
+
+def main():
+  size = int(sys.argv[1] if len(sys.argv) > 1 else 1024) * 1024
+  baud = int(sys.argv[2] if len(sys.argv) > 2 else 921600)
+  workers = int(sys.argv[3] if len(sys.argv) > 3 else 0)
+
+  print('%-6s %-8s %10s %10s %10s %10s' % ('view', 'pace', 'KB', 'sec', 'KB/s', 'inserts'))
+  for mode in ('va_hex', 'va_asc'):
+    for speed in (1.0, 0):
+      sec, view = run(size, baud, speed, mode, workers)
+      print('%-6s %-8s %10d %10.3f %10.1f %10d' % (mode[3:], '%d' % baud if speed else 'max',
+                                                  size // 1024, sec, size / 1024 / sec, view.inserts))
+
+
+if __name__ == '__main__':
+  main()
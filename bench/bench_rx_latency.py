@@ -0,0 +1,93 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# bench_rx_latency.py     first-byte receive latency over a pty loopback
+#
+# Writes single bytes into the master side of a pseudo-terminal and measures
+# how long it takes until the chunk shows up in Terminal.rxQ, once with the
+# current listener and once with the former 20 ms inWaiting() poll loop.
+#
+# usage: python bench/bench_rx_latency.py [samples]
+#
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from terminal import Terminal
+
+
+class PollTerminal(Terminal):
+  def listener(self):
+    # the listener as it was before, kept here as a reference point
+    self._serial.timeout = None
+    while self.connected and self._serial.isOpen():
+      cnt = self._serial.inWaiting()
+      if cnt:
+        self.rxQ.put((time.monotonic_ns(), self._serial.read(cnt)))
+      time.sleep(0.02)
+
+    self.connected = False
+
+
+def percentile(values, p):
+  s = sorted(values)
+  return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+
+def measure(term_class, samples):
+  master, slave = os.openpty()
+  term = term_class()
+  term.settings['device'] = os.ttyname(slave)
+  if not term.connect():
+    raise RuntimeError(term.status.get())
+
+  lat = []
+  try:
+    for i in range(samples):
+      # random gap so the samples do not lock onto the poll period
+      time.sleep(random.uniform(0.001, 0.025))
+      t0 = time.perf_counter()
+      os.write(master, b'\x55')
+      term.rxQ.get(timeout=1.0)
+      term.rx_release()
+      lat.append((time.perf_counter() - t0) * 1000.0)
+  finally:
+    term.disconnect()
+    os.close(master)
+    os.close(slave)
+
+  return lat
+
+
+def main():
+  samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  print('%-8s %10s %10s %10s' % ('path', 'p50 [ms]', 'p99 [ms]', 'max [ms]'))
+  for name, cls in (('poll', PollTerminal), ('event', Terminal)):
+    lat = measure(cls, samples)
+    print('%-8s %10.3f %10.3f %10.3f' % (name, percentile(lat, 50), percentile(lat, 99), max(lat)))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,93 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# bench_startup.py     cold start time
+#
+# Times each startup step in a fresh interpreter, next to the work that
+# was moved off the startup path: the port scan, now done by
+# discovery.PortWatcher, and the PIL import and icon decoding, now done by
+# TermView.load_icons() once the window is up. The window steps need a
+# display.
+#
+# usage: python bench/bench_startup.py [runs]
+#
+
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STEPS = r'''
+import sys, time, os
+sys.path.insert(0, %(root)r)
+os.chdir(%(root)r)
+t = time.perf_counter()
+def step(name):
+  global t
+  now = time.perf_counter()
+  print('%%s %%.6f' %% (name, now - t))
+  t = time.perf_counter()
+
+import serial
+step('import serial')
+import terminal
+step('import terminal')
+terminal.Terminal()
+step('Terminal()')
+import termview
+step('import termview')
+if os.environ.get('DISPLAY'):
+  view = termview.TermView()
+  view.update()
+  step('TermView() shown')
+  view.load_icons()
+  step('load_icons()')
+  view.destroy()
+from serial.tools import list_ports
+step('import list_ports')
+list_ports.comports()
+step('comports()')
+try:
+  from PIL import Image, ImageTk
+  step('import PIL')
+except ImportError:
+  pass
+'''
+
+
+def run():
+  out = subprocess.check_output([sys.executable, '-c', STEPS % {'root': ROOT}]).decode()
+  return [(line.rsplit(' ', 1)[0], float(line.rsplit(' ', 1)[1])) for line in out.splitlines()]
+
+
+def main():
+  runs = int(sys.argv[1] if len(sys.argv) > 1 else 5)
+  results = [run() for _ in range(runs)]
+  print('%-20s %10s %10s' % ('step', 'best ms', 'median ms'))
+  for i, (name, _) in enumerate(results[0]):
+    times = sorted(r[i][1] for r in results)
+    print('%-20s %10.2f %10.2f' % (name, times[0] * 1e3, times[len(times) // 2] * 1e3))
+  print('\nsteps after "import termview" are off the startup path')
+
+
+if __name__ == '__main__':
+  main()
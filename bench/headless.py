@@ -0,0 +1,101 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# headless.py     stand-ins for TermView and TermInteractor
+#
+# Lets TermPresenter run without a display, the view only counts what
+# would have been inserted into the terminal window.
+#
+
+import time
+
+
+class Var(object):
+  # minimal tk variable
+  def __init__(self, value=None):
+    self.value = value
+
+  def get(self):
+    return self.value
+
+  def set(self, value):
+    self.value = value
+
+  def trace(self, mode, callback):
+    pass
+
+
+class Widget(object):
+  def config(self, **kwargs):
+    pass
+
+  configure = config
+
+
+class HeadlessView(object):
+  def __init__(self):
+    for name in ['view_var', 'toggle_lf', 'toggle_cr', 'toggle_echo', 'toggle_open',
+                 'toggle_mod', 'toggle_xor', 'toggle_rep', 'toggle_time', 'toggle_stats',
+                 'port_set', 'baud_set', 'bits_set', 'pary_set', 'stop_set', 'flow_set', 'busy_var',
+                 'frame_set', 'check_set', 'sum_set', 'res_set', 'rate_set', 'metrics_var',
+                 'search_var', 'search_kind', 'search_info']:
+      setattr(self, name, Var())
+    self.frame_box = Widget()
+    self.check_box = Widget()
+    self.sum_box = Widget()
+    self.res_box = Widget()
+    self.rate_box = Widget()
+    self.search_box = Widget()
+    self.cfg = {key: Widget() for key in ['port', 'baud', 'bits', 'pary', 'stop', 'flow']}
+    self.clear()
+
+  def put_line(self, line, tag):
+    self.inserts += 1
+    self.chars += len(line)
+    self.end_line += line.count('\n')
+    self.last = time.perf_counter()
+
+  def clear(self):
+    self.inserts = 0
+    self.chars = 0
+    self.end_line = 0
+    self.last = None
+
+  def title(self, title):
+    pass
+
+  def show_stats(self, enabled):
+    pass
+
+  def set_stats(self, text):
+    self.stats = text
+
+
+class HeadlessInteractor(object):
+  def install(self, presenter, view):
+    self.presenter = presenter
+    self.view = view
+
+  def run_until(self, done, timeout=60.0):
+    # drive the presenter update loop until done() or timeout
+    end = time.monotonic() + timeout
+    while not done() and time.monotonic() < end:
+      time.sleep(self.presenter.on_update() / 1000.0)
@@ -0,0 +1,176 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# suite.py     benchmark suite of Bt3
+#
+# Micro-benchmarks of the hot paths over realistic payload sizes and
+# end-to-end runs through a pty loopback into TermPresenter at standard
+# baud rates. Results are written as JSON, --compare prints the ratio to
+# an earlier results file so regressions show between commits.
+#
+# usage: python bench/suite.py [-o results.json] [--compare old.json] [--quick]
+#
+
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from support import Observable, HexDumper, hex_dump, sum_mod, sum_xor
+from framing import FRAMERS, cobs_encode
+from checksum import CHECKSUMS
+from linkstats import LinkStats
+
+SIZES = (16, 256, 4096, 65536)
+BAUDS = (9600, 115200, 921600)
+
+
+def measure(func, repeat=5):
+  # best time per call [s] of repeat rounds, each round long enough to time
+  timer = timeit.Timer(func)
+  number, _ = timer.autorange()
+  return min(timer.repeat(repeat, number)) / number
+
+
+def payload(size):
+  # printable lines with some binary, like a typical debug stream
+  line = b'The quick brown fox jumps over the lazy dog 0123456789\x00\x7f\xff\r\n'
+  return (line * (size // len(line) + 1))[:size]
+
+
+def frames_for(name, data):
+  # data cut into 64 byte frames encoded for framer name
+  frames = [data[i:i + 64] for i in range(0, len(data), 64)]
+  if name == 'line':
+    return b''.join(f.replace(b'\n', b' ') + b'\n' for f in frames)
+  if name == 'slip':
+    return b''.join(f.replace(b'\xdb', b'\xdb\xdd').replace(b'\xc0', b'\xdb\xdc') + b'\xc0' for f in frames)
+  if name == 'cobs':
+    return b''.join(cobs_encode(f) + b'\x00' for f in frames)
+  if name == 'len8':
+    return b''.join(bytes([len(f)]) + f for f in frames)
+  if name == 'len16':
+    return b''.join(len(f).to_bytes(2, 'big') + f for f in frames)
+  return data
+
+
+def micro(sizes):
+  # yield (name, size, seconds per call)
+  for size in sizes:
+    data = payload(size)
+    yield 'hex_dump', size, measure(lambda: hex_dump(data))
+    dumper = HexDumper()
+    yield 'HexDumper.feed', size, measure(lambda: dumper.feed(data))
+    yield 'sum_mod', size, measure(lambda: sum_mod(data))
+    yield 'sum_xor', size, measure(lambda: sum_xor(data))
+    for name in ('crc8', 'crc16-modbus', 'crc32'):
+      check = CHECKSUMS[name]
+      yield 'checksum.' + name, size, measure(lambda: check.compute(data))
+    for name in FRAMERS:
+      if name == 'raw':
+        continue
+      framer = FRAMERS[name]()
+      stream = frames_for(name, data)
+      yield 'framer.' + name, size, measure(lambda: framer.feed(stream))
+    stats = LinkStats()
+    yield 'LinkStats.feed', size, measure(lambda: stats.feed(data, 0))
+
+  for n in (1, 4, 16):
+    obs = Observable()
+    for i in range(n):
+      obs.addCallback(lambda value: None)
+    yield 'Observable.set', n, measure(lambda: obs.set(b'x'))
+
+
+def end_to_end(bauds, seconds):
+  # yield (name, baud, result) of paced and unpaced pty replays
+  from bench_replay import run
+  for baud in bauds:
+    size = max(1024, int(baud / 10 * seconds))
+    for mode in ('va_hex', 'va_asc'):
+      for speed in (1.0, 0):
+        sec, view = run(size, baud, speed, mode)
+        yield 'replay.%s.%s' % (mode[3:], 'paced' if speed else 'max'), baud, {
+          'bytes': size, 'seconds': sec, 'bytes_per_sec': size / sec, 'inserts': view.inserts}
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                   stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def compare(results, path):
+  # print the speed of results relative to the results file at path
+  with open(path) as f:
+    old = {(r['name'], r['size']): r for r in json.load(f)['results']}
+  print('\n%-28s %8s %10s' % ('compared to ' + os.path.basename(path), 'size', 'speedup'))
+  for r in results:
+    o = old.get((r['name'], r['size']))
+    if o is None:
+      continue
+    if 'seconds_per_call' in r:
+      ratio = o['seconds_per_call'] / r['seconds_per_call']
+    else:
+      ratio = r['bytes_per_sec'] / o['bytes_per_sec']
+    print('%-28s %8d %9.2fx%s' % (r['name'], r['size'], ratio, '  <-- slower' if ratio < 0.9 else ''))
+
+
+def main(argv=None):
+  p = argparse.ArgumentParser(description='Bt3 benchmark suite.')
+  p.add_argument('-o', '--output', default='bench-results.json', help='results file (default bench-results.json)')
+  p.add_argument('--compare', metavar='PATH', help='print the speedup relative to an earlier results file')
+  p.add_argument('--quick', action='store_true', help='small payloads and short runs')
+  p.add_argument('--no-e2e', action='store_true', help='skip the pty end-to-end runs')
+  args = p.parse_args(argv)
+
+  results = []
+  print('%-28s %8s %12s %10s' % ('benchmark', 'size', 'us/call', 'MB/s'))
+  for name, size, sec in micro(SIZES[:3] if args.quick else SIZES):
+    results.append({'name': name, 'size': size, 'seconds_per_call': sec})
+    rate = '%10.2f' % (size / sec / 1e6) if name != 'Observable.set' else ''
+    print('%-28s %8d %12.3f %s' % (name, size, sec * 1e6, rate))
+
+  if not args.no_e2e:
+    print('\n%-28s %8s %12s %10s' % ('end to end', 'baud', 'KB/s', 'inserts'))
+    for name, baud, r in end_to_end(BAUDS, 0.5 if args.quick else 2.0):
+      results.append(dict(name=name, size=baud, **r))
+      print('%-28s %8d %12.1f %10d' % (name, baud, r['bytes_per_sec'] / 1024, r['inserts']))
+
+  with open(args.output, 'w') as f:
+    json.dump({'commit': git_commit(), 'time': time.time(), 'python': platform.python_version(),
+               'platform': platform.platform(), 'results': results}, f, indent=1)
+
+  if args.compare:
+    compare(results, args.compare)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,325 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# bridge.py     sharing the open port of Bt3 over TCP
+#
+# Only one process can open a serial port. A Bridge lets any number of
+# TCP clients (nc, telnet, another bt3cli or pyserial's rfc2217:// URLs)
+# watch and talk to the port Bt3 has open.
+#
+# Received chunks are appended once to a log shared by all clients, each
+# client only keeps its position in the log. One thread sends from the
+# log to non-blocking sockets, so a slow client never holds up the
+# receiving thread or the other clients: it falls behind, and once its
+# position is older than history bytes it skips ahead and the skipped
+# bytes are counted. What clients send goes to the TX queue of the port,
+# one frame per read, clients are served in turn.
+#
+
+import os
+import time
+import socket
+import selectors
+import threading
+import collections
+
+import serial
+from serial.rfc2217 import PortManager
+
+
+def parse_address(spec, host='127.0.0.1'):
+  # [HOST:]PORT -> (host, port), by default the bridge is local only
+  if ':' in spec:
+    host, spec = spec.rsplit(':', 1)
+  return host, int(spec)
+
+
+class _PortView(object):
+  # the port as PortManager sees it for an RFC 2217 client. settings are
+  # read from the open port, changes are only applied with allow_settings,
+  # otherwise the client is answered with the current value and refuses.
+  # control lines the port doesn't have are ignored.
+  SETTINGS = {'baudrate': 'speed', 'bytesize': 'databits', 'parity': 'parity', 'stopbits': 'stopbits'}
+
+  def __init__(self, bridge):
+    object.__setattr__(self, 'bridge', bridge)
+
+  def __getattr__(self, name):
+    port = self.bridge.term._serial
+    if name in ('cts', 'dsr', 'ri', 'cd'):
+      try:
+        return getattr(port, name)
+      except (serial.SerialException, OSError):
+        return False      # no modem lines, e.g. a pseudo-terminal
+    if name in ('reset_input_buffer', 'reset_output_buffer'):
+      return lambda: None # the buffers are shared with the other clients
+    return getattr(port, name)
+
+  def __setattr__(self, name, value):
+    if not self.bridge.allow_settings:
+      return
+    try:
+      setattr(self.bridge.term._serial, name, value)
+    except (serial.SerialException, OSError) as ex:
+      if name in self.SETTINGS:
+        raise ValueError(str(ex))
+      return
+    if name in self.SETTINGS:
+      self.bridge.term.settings[self.SETTINGS[name]] = value
+
+
+class _Client(object):
+  # one TCP connection of a Bridge
+  def __init__(self, sock, addr, seq, off):
+    self.sock = sock
+    self.addr = addr
+    self.seq = seq            # log sequence number of the next chunk to send
+    self.off = off            # stream offset of that chunk
+    self.cur = None           # memoryview of what is left of the chunk being sent
+    self.ctl = bytearray()    # telnet replies, sent in between chunks
+    self.tx = None            # bytes waiting for room in the TX queue
+    self.blocked = False      # the socket buffer is full
+    self.events = 0           # selector events registered
+    self.manager = None       # serial.rfc2217.PortManager of a telnet client
+    self.sent = 0
+    self.dropped = 0          # bytes skipped because the client fell behind
+
+  def write(self, b):
+    # telnet output of the PortManager
+    self.ctl += b
+
+  @property
+  def name(self):
+    return '%s:%d' % self.addr[:2]
+
+
+class Bridge(object):
+  """Bridge - Shares the open port of a Terminal with TCP clients.
+
+     With telnet the clients speak Telnet with the RFC 2217 com port
+     option, raw otherwise. history is the number of received bytes kept
+     for clients that fall behind. allow_tx passes what clients send to
+     the port, allow_settings lets RFC 2217 clients change its settings.
+     Set it as Terminal.bridge to have it fed from the receiving thread.
+  """
+  def __init__(self, term, host='127.0.0.1', port=0, telnet=False, history=1 << 20,
+               allow_tx=True, allow_settings=False):
+    self.term = term
+    self.telnet = telnet
+    self.history = history
+    self.allow_tx = allow_tx
+    self.allow_settings = allow_settings
+    self.poll = 0.1           # seconds between retries of held back TX
+    self.lock = threading.Lock()
+    self.log = collections.deque()  # [offset, bytes, telnet escaped bytes] of the received chunks
+    self.base = 0             # sequence number of log[0]
+    self.base_off = 0         # stream offset of log[0]
+    self.end_off = 0          # stream offset past the last chunk
+    self.clients = []
+    self.accepted = 0
+    self.active = False
+    self.thd = None
+    self._woken = False
+    self._sel = selectors.DefaultSelector()
+    self._wake_r, self._wake_w = os.pipe()
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.sock.bind((host, port))
+
+  @property
+  def address(self):
+    """(host, port) the bridge listens on."""
+    return self.sock.getsockname()[:2]
+
+  def start(self):
+    self.sock.listen(8)
+    self.sock.setblocking(False)
+    self._sel.register(self.sock, selectors.EVENT_READ, self)
+    self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+    self.active = True
+    self.thd = threading.Thread(target=self.run)
+    self.thd.daemon = True
+    self.thd.start()
+
+  def stop(self):
+    """Disconnect the clients and stop listening."""
+    if self.thd:
+      self.active = False
+      os.write(self._wake_w, b'\x00')
+      self.thd.join()
+      self.thd = None
+    for c in list(self.clients):
+      self._drop(c, False)
+    self._sel.close()
+    self.sock.close()
+    os.close(self._wake_r)
+    os.close(self._wake_w)
+
+  def feed(self, data):
+    """Hand a received chunk to the clients, called on the receiving thread."""
+    data = bytes(data)
+    with self.lock:
+      self.log.append([self.end_off, data, None])
+      self.end_off += len(data)
+      while self.end_off - self.base_off > self.history and len(self.log) > 1:
+        self.log.popleft()
+        self.base += 1
+        self.base_off = self.log[0][0]
+      wake = not self._woken
+      self._woken = True
+    if wake:
+      os.write(self._wake_w, b'\x00')
+
+  def run(self):
+    modem_at = 0.0
+    while self.active:
+      for key, mask in self._sel.select(self.poll):
+        if key.data is None:
+          os.read(self._wake_r, 512)
+          self._woken = False
+        elif key.data is self:
+          self._accept()
+        elif mask & selectors.EVENT_READ:
+          self._recv(key.data)
+
+      for c in list(self.clients):
+        if c.tx:
+          self._transmit(c)
+        self._send(c)
+
+      if self.telnet and time.monotonic() >= modem_at:
+        modem_at = time.monotonic() + 1.0
+        for c in self.clients:
+          c.manager.check_modem_lines()
+
+  def _accept(self):
+    try:
+      sock, addr = self.sock.accept()
+    except (BlockingIOError, InterruptedError):
+      return
+    sock.setblocking(False)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    with self.lock:
+      c = _Client(sock, addr, self.base + len(self.log), self.end_off)   # starts with what arrives next
+    if self.telnet:
+      c.manager = PortManager(_PortView(self), c)
+    self.clients.append(c)
+    self.accepted += 1
+    self._watch(c)
+    self.term.status.set('Bridge client %s connected.' % c.name)
+
+  def _drop(self, c, report=True):
+    if c.events:
+      self._sel.unregister(c.sock)
+    c.sock.close()
+    self.clients.remove(c)
+    if report:
+      self.term.status.set('Bridge client %s left, %d bytes sent, %d dropped.' % (c.name, c.sent, c.dropped))
+
+  def _watch(self, c):
+    # read from c unless its TX is held back, wait for room to write while
+    # its socket buffer is full
+    events = (0 if c.tx else selectors.EVENT_READ) | (selectors.EVENT_WRITE if c.blocked else 0)
+    if events == c.events:
+      return
+    if not c.events:
+      self._sel.register(c.sock, events, c)
+    elif not events:
+      self._sel.unregister(c.sock)
+    else:
+      self._sel.modify(c.sock, events, c)
+    c.events = events
+
+  def _recv(self, c):
+    try:
+      data = c.sock.recv(4096)
+    except (BlockingIOError, InterruptedError):
+      return
+    except OSError:
+      data = b''
+    if not data:
+      self._drop(c)
+      return
+    if c.manager:
+      data = b''.join(c.manager.filter(data))
+    if data and self.allow_tx:
+      c.tx = data
+      self._transmit(c)
+
+  def _transmit(self, c):
+    # queue the bytes of c as one frame, while the TX queue is full they
+    # are held back and c is not read from, its TCP window pushes back
+    if not self.term.connected:
+      c.tx = None
+    elif not self.term.tx_full() and self.term.send(c.tx):
+      c.tx = None
+    self._watch(c)
+
+  def _next(self, c):
+    # return the next chunk for c, skipping what the log no longer holds
+    with self.lock:
+      if c.seq < self.base:
+        c.dropped += self.base_off - c.off
+        c.seq = self.base
+        c.off = self.base_off
+      if c.seq == self.base + len(self.log):
+        return None
+      entry = self.log[c.seq - self.base]
+    c.seq += 1
+    c.off = entry[0] + len(entry[1])
+    if not c.manager:
+      return entry[1]
+    if entry[2] is None:
+      entry[2] = entry[1].replace(b'\xff', b'\xff\xff')   # IAC is doubled in telnet data
+    return entry[2]
+
+  def _send(self, c):
+    # send c what it has not seen yet, until its socket buffer is full
+    try:
+      while True:
+        if c.cur is None:
+          if c.ctl:
+            data = bytes(c.ctl)
+            del c.ctl[:]
+          else:
+            data = self._next(c)
+            if data is None:
+              break
+          c.cur = memoryview(data)
+        n = c.sock.send(c.cur)
+        c.sent += n
+        c.cur = c.cur[n:] if n < len(c.cur) else None
+        if c.cur is not None:
+          break
+    except (BlockingIOError, InterruptedError):
+      pass
+    except OSError:
+      self._drop(c)
+      return
+    c.blocked = c.cur is not None
+    self._watch(c)
+
+  def report(self):
+    host, port = self.address
+    lines = ['Bridge %s:%d, %d clients, %d accepted' % (host, port, len(self.clients), self.accepted)]
+    for c in self.clients:
+      lines.append('  %-21s %10d bytes sent %10d dropped' % (c.name, c.sent, c.dropped))
+    return '\n'.join(lines)
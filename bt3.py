@@ -33,120 +33,27 @@
 #  Bt3 can append CR+LF or one of both to each frame.
 
 import time
-import threading
 import queue
+import argparse
 import tkinter as tk
-import serial
-import serial.tools.list_ports
 
+from terminal import Terminal
 from termview import TermView
 from preset import PresetGUI
 from support import *
-
-
-class Terminal(object):
-  def __init__(self):
-    self._serial = serial.Serial()
-
-    self.options = {'device': [],
-                    'speed': self._serial.BAUDRATES,
-                    'databits': self._serial.BYTESIZES,
-                    'parity': self._serial.PARITIES,
-                    'stopbits': self._serial.STOPBITS,
-                    'flow': ['hardware', 'software', 'None']}
-
-    self.settings = {'device': '',
-                     'speed': 115200,
-                     'databits': 8,
-                     'parity': 'N',
-                     'stopbits': 1,
-                     'flow': 'None'}
-
-    devices = [item for item in serial.tools.list_ports.comports()]
-    if (devices):
-      self.options['device'] = list([item[0] for item in devices])
-      self.settings['device'] = self.options['device'][0]
-
-    self.sum_type = ''         # checksum type
-    self.echo_enable = True    # enable local echo
-    self.lf_enable = False     # add line feed
-    self.cr_enable = False     # add carriage return
-    self.status = Observable() # observe status msg
-    self.echo = Observable()   # observe local echo
-    self.connected = False     # status
-    self.rxQ = queue.Queue()   # receive queue
-
-
-  def listener(self):
-    # listening thread
-    self._serial.timeout = None
-    while self.connected and self._serial.isOpen():
-      cnt = self._serial.inWaiting()
-      if cnt:
-        self.rxQ.put(self._serial.read(cnt))
-      time.sleep(0.02)
-
-    self.connected = False
-
-
-  def connect(self):
-    self._serial.port =     self.settings['device']
-    self._serial.baudrate = self.settings['speed']
-    self._serial.bytesize = self.settings['databits']
-    self._serial.parity =   self.settings['parity']
-    self._serial.stopbits = self.settings['stopbits']
-    # TODO flow control
-
-    try:
-      self._serial.open()
-    except (serial.SerialException, ValueError) as ex:
-      self.status.set('Error while connecting to %s:\n%s' % (self.settings['device'], str(ex)))
-    else:
-      if (self._serial.isOpen()):
-        self.status.set('Connected to %s (%d/%d/%s/%d).' % (self.settings['device'],
-                                                             self.settings['speed'],
-                                                             self.settings['databits'],
-                                                             self.settings['parity'],
-                                                             self.settings['stopbits']))
-        # start the listener
-        self.rx_thd = threading.Thread(target=self.listener)
-        self.rx_thd.setDaemon(True)
-        self.connected = True
-        self.rx_thd.start()
-      else:
-        self.status.set('Unable to open %s.' % self.settings['device'])
-
-    return self.connected
-
-
-  def disconnect(self):
-    self.connected = False
-    self.rx_thd.join()
-    self._serial.close()
-    self.status.set('Serial device closed.')
-
-
-  def talk(self, line):
-    if self.connected:
-      b = [ord(i) for i in line]
-
-      if self.cr_enable:
-        b.append(0x0D)
-      if self.lf_enable:
-        b.append(0x0A)
-
-      if self.sum_type == 'mod':
-        b.append(sum_mod(b))
-      elif self.sum_type == 'xor':
-        b.append(sum_xor(b))
-
-      if self.echo_enable:
-        self.echo.set(bytes(b))
-
-      self._serial.write(bytes(b))
-    else:
-      self.status.set('Not connected.')
-
+from framing import FRAMERS, DelimiterFramer
+from checksum import CHECKSUMS
+from generator import TrafficGenerator
+from search import StreamIndex, Search, compile_query, KINDS
+from triggers import Responder
+from discovery import PortWatcher
+from metrics import Metrics, MetricsExporter, terminal_metrics, COUNTER, GAUGE
+from pipeline import FormatPool, format_frames
+from bridge import Bridge, parse_address
+from events import EventBus
+from linkstats import LinkStats
+from capture import CaptureWriter
+from session import Session, parse_spec, port_settings
 
 
 class TermPresenter(object):
@@ -157,8 +64,77 @@ class TermPresenter(object):
     self.pv = None
 
     self.rep_active =  False
+    self.rep_wait = 0.1           # seconds the repeater waits for TX room before retrying
     self.time_active = False
-    self.line_bytes = b''
+    self.timecode = Timecode()
+    self.char_ns = 0
+    self.rx_dump = HexDumper()                        # hex view of the raw stream
+    self.rx_lines = DelimiterFramer(b'\n', strip=True)  # ascii view of the raw stream
+    self.framer = None                                 # framing.Framer of RX, None for the raw stream
+    self.framer_name = 'raw'
+    self.rx_check = None                               # checksum.Checksum RX frames must pass
+    self.bad_frames = 0
+    self.rx_index = StreamIndex()                      # raw stream for searching, see on_search()
+    self.frame_start = 0                               # rx_index offset of the next frame
+    self.run_line = 0                                  # scrollback line the next run starts on
+    self.search = None
+    self.search_query = None
+    self.match = None
+
+    # update loop tuning, see on_update()
+    self.frame_budget = 0.008     # max seconds spent draining rxQ per tick
+    self.frame_bytes = 65536      # max bytes rendered per tick
+    self.tick_min = 10            # tick interval [ms] while data is flowing
+    self.tick_max = 100           # tick interval [ms] when the line is idle
+    self.tick = self.tick_min
+    self.catching_up = False
+
+    # formatting in worker processes, see start_pool()
+    self.pool = None              # pipeline.FormatPool
+    self.carry = b''              # partial frame held back from the pool
+    self.pool_errors = 0          # frames dropped by the framers of the pool, see render_block()
+
+    # port discovery and reconnect, see on_ports() and on_lost()
+    self.watcher = PortWatcher()
+    self.ports = None             # port list shown in the view
+    self.link_id = None           # discovery.port_id of the open port, None when closed by the user
+    self.lost = False             # the open port went away
+    self.reconnect_interval = 1.0 # seconds between attempts to reopen a lost port
+    self.reconnect_at = 0.0
+    self.reconnecting = False     # the status of an attempt to reopen is not shown
+
+    # read-only ports shown along with the open one, see add_monitor()
+    self.session = None           # session.Session of the monitored ports
+    self.monitors = {}            # port name -> DelimiterFramer of its ascii lines
+    self.monitor_dumps = {}       # port name -> HexDumper of its hex view
+
+    # statistics of the received stream, fed only once asked for, see start_stats()
+    self.keep_stats = False       # keep feeding them while the panel is hidden
+
+    # model events reach the view on the update tick, see on_update()
+    self.events = EventBus()
+    self.events.topic('status', priority=0, maxlen=256, batch=True)
+    self.events.topic('echo', priority=1, maxlen=1024, batch=True)
+
+    # runtime metrics, see metrics.py
+    self.rx_frames = 0            # frames rendered, lines in the ascii view
+    self.tick_time = 0.0          # seconds spent in the last on_update
+    self.lag_ns = 0               # receive to screen delay of the oldest chunk of the last tick
+    self.metrics = Metrics()
+    self.metrics_interval = 1.0   # status bar update interval [s]
+    self.metrics_next = 0.0
+    self.metrics_last = None
+    self.exporter = None          # MetricsExporter, see export_metrics()
+    terminal_metrics(self.metrics, term)
+    self.metrics.add('rx_frames', lambda: self.rx_frames, COUNTER, 'frames rendered')
+    self.metrics.add('rx_bad_frames', lambda: self.bad_frames, COUNTER, 'frames failing the RX checksum')
+    self.metrics.add('rx_frame_errors', self.frame_errors, COUNTER, 'frames dropped by the framer')
+    self.metrics.add('render_lag_seconds', lambda: self.lag_ns / 1e9, GAUGE, 'receive to screen delay')
+    self.metrics.add('render_tick_seconds', lambda: self.tick_time, GAUGE, 'time spent in the last update tick')
+    self.metrics.add('events_dropped', lambda: self.events.dropped, COUNTER, 'echo and status events dropped')
+    if hasattr(view, 'scrollback'):
+      self.metrics.add('scrollback_dropped', lambda: view.scrollback.dropped, COUNTER,
+                       'lines pushed out of the scrollback')
 
     # set the initial view state
     view.view_var.set('va_hex')
@@ -173,6 +149,19 @@ class TermPresenter(object):
       view.toggle_xor.set(True)
 
     view.toggle_rep.set(False)
+    view.rate_box.config(values=['1', '10', '100', '1000', 'max'])
+    view.rate_set.set('1')
+
+    view.frame_box.config(values=list(FRAMERS))
+    view.frame_set.set('raw')
+    view.check_box.config(values=['none'] + list(CHECKSUMS))
+    view.check_set.set('none')
+    view.sum_box.config(values=['none'] + list(CHECKSUMS))
+    view.sum_set.set(self.term.sum_type or 'none')
+    view.res_box.config(values=list(Timecode.RESOLUTIONS))
+    view.res_set.set(self.timecode.resolution)
+    view.search_box.config(values=list(KINDS))
+    view.search_kind.set('bytes')
 
     view.cfg['port'].config(values=term.options['device'])
     view.port_set.set(term.settings['device'])
@@ -189,9 +178,14 @@ class TermPresenter(object):
     view.cfg['stop'].config(values=term.options['stopbits'])
     view.stop_set.set(term.settings['stopbits'])
 
-    # attach to model
-    term.status.addCallback(self.on_status)
-    term.echo.addCallback(self.on_echo)
+    view.cfg['flow'].config(values=term.options['flow'])
+    view.flow_set.set(term.settings['flow'])
+
+    # attach to model, the callbacks run on whatever thread reports
+    term.status.addCallback(self.on_model_status)
+    self.events.forward(term.echo, 'echo')
+    self.events.subscribe('status', self.on_statuses)
+    self.events.subscribe('echo', self.on_echo)
 
     interactor.install(self, view)
     self.active= False
@@ -200,61 +194,389 @@ class TermPresenter(object):
   def run(self, title=''):
     self.view.title(title)
     self.active = True
+    self.watcher.start()
+    if self.session:
+      self.session.connect()
     self.view.mainloop()
+    if self.session:
+      self.session.disconnect()
+    self.watcher.stop()
 
 
-  def set_cfg_enabled(self, enabled):
-    for wgt in self.view.cfg:
-      self.view.cfg[wgt].configure(state = 'normal' if enabled else 'disabled')
+  def add_monitor(self, name, settings=None):
+    # show port name read-only next to the open port, its lines tagged
+    # with the name and interleaved with the open port by arrival time
+    if self.session is None:
+      self.session = Session()
+    term = self.session.add(name, settings)
+    term.echo_enable = False
+    term.status.addCallback(lambda status, n=name: self.events.post('status', '%s: %s' % (n, status)))
+    terminal_metrics(self.metrics, term, 'monitor%d' % len(self.monitors))
+    self.monitors[name] = DelimiterFramer(b'\n', strip=True)
+    self.monitor_dumps[name] = HexDumper()
+    return term
 
 
-  def on_status(self, status):
-    self.view.put_line('\n#STATUS: %s\n' % status, 'foreground_grn')
+  def frame_errors(self):
+    # read on the metrics exporter thread, on_frame() may replace the framer meanwhile
+    framer = self.framer
+    return (framer.errors if framer else 0) + self.pool_errors
 
 
-  def part(self, a, tag):
-    q = a.partition(b'\n')
-    while q[1] == b'\n':
-      try:
-        line = q[0].decode('ascii', errors='ignore')
-        if self.time_active:
-          self.view.put_line("%s %s\n" % (get_timecode(), line), tag)
-        else:
-          self.view.put_line("%s\n" % line, tag)
-      except UnicodeDecodeError as E:
-        self.on_status(str(E))
-      a = q[2]
-      q = a.partition(b'\n')
-
-    return a
+  def set_cfg_enabled(self, enabled):
+    for wgt in self.view.cfg:
+      self.view.cfg[wgt].configure(state = 'normal' if enabled else 'disabled')
 
 
-  def put_line(self, bytes_val, tag):
+  def on_status(self, status):
+    # through the bus like the status of the model, so it shows after the
+    # messages posted before it
+    self.events.post('status', status)
+
+
+  def on_model_status(self, status):
+    # on whatever thread reports, see on_lost()
+    if not self.reconnecting:
+      self.events.post('status', status)
+
+
+  def on_statuses(self, statuses):
+    self.view.put_line(''.join(['\n#STATUS: %s\n' % s for s in statuses]), 'foreground_grn')
+
+
+  def text_lines(self, frames, times=None):
+    # return frames as a list of text lines for the ascii view, stamped
+    # with times or the current time
+    if self.time_active:
+      tc = self.timecode.format
+      if times is None:
+        times = [time.monotonic_ns()] * len(frames)
+      return ["%s %s\n" % (tc(t), f.decode('ascii', errors='ignore')) for f, t in zip(frames, times)]
+    return ["%s\n" % f.decode('ascii', errors='ignore') for f in frames]
+
+
+  def format_lines(self, frames, times=None):
+    return ''.join(self.text_lines(frames, times))
+
+
+  def frame_times(self, framer, t_ns, char_ns=None):
+    # arrival times of the frames framer just completed, interpolated back
+    # from t_ns, the arrival of the last byte fed, at the character rate
+    if char_ns is None:
+      char_ns = self.char_ns
+    end = framer.offset + len(framer.buf)
+    return [t_ns - (end - e) * char_ns for e in framer.ends]
+
+
+  def frame_ends(self, framer):
+    # rx_index offsets of the ends of the frames framer just completed
+    end = framer.offset + len(framer.buf)
+    return [self.rx_index.end - (end - e) for e in framer.ends]
+
+
+  def anchor_frames(self, ends, lines):
+    # map the frames ending at rx_index offsets ends to their number of
+    # lines in the runs added next
+    for end, n in zip(ends, lines):
+      self.rx_index.anchor_frame(self.frame_start, self.run_line, n)
+      self.run_line += n
+      self.frame_start = end
+
+
+  def render_frames(self, frames, times, runs, ends):
+    # add RX frames to runs, frames failing rx_check are tagged foreground_bad
+    formatted = format_frames(frames, times, self.view.view_var.get() == 'va_hex',
+                              self.timecode if self.time_active else None, self.rx_check)
+    self.anchor_frames(ends, [text.count('\n') for text, _ in formatted])
+    if self.rx_check:
+      self.bad_frames += sum([1 for _, tag in formatted if tag == 'foreground_bad'])
+    runs.extend(formatted)
+
+
+  def put_runs(self, runs):
+    # insert (text, tag) runs, neighbours with the same tag in one insert
+    text = []
+    tag = None
+    for t, g in runs:
+      if g != tag and text:
+        self.view.put_line(''.join(text), tag)
+        text = []
+      tag = g
+      if t:
+        text.append(t)
+    if text:
+      self.view.put_line(''.join(text), tag)
+
+
+  def put_rx(self, chunks):
+    # render a list of received (t_ns, bytes) chunks
+    if not self.framer and self.view.view_var.get() == 'va_hex':
+      bytes_val = b''.join([c for _, c in chunks])
+      offset = self.rx_index.end - len(self.rx_dump.pending)
+      col = self.rx_dump.offset % 16
+      self.rx_index.append(bytes_val)
+      text = self.rx_dump.feed(bytes_val)
+      if text:
+        self.rx_index.anchor_row(offset, self.view.end_line, col)
+        self.view.put_line(text, 'foreground_blk')
+      return
+
+    self.char_ns = self.term.char_time()
+    self.run_line = self.view.end_line
+    runs = []
+    for t_ns, bytes_val in chunks:
+      self.rx_index.append(bytes_val)
+      if self.framer:
+        frames = self.framer.feed(bytes_val)
+        if frames:
+          self.rx_frames += len(frames)
+          self.render_frames(frames, self.frame_times(self.framer, t_ns), runs, self.frame_ends(self.framer))
+      else:
+        lines = self.rx_lines.feed(bytes_val)
+        if lines:
+          self.rx_frames += len(lines)
+          texts = self.text_lines(lines, self.frame_times(self.rx_lines, t_ns))
+          self.anchor_frames(self.frame_ends(self.rx_lines), [1] * len(texts))
+          runs.append((''.join(texts), 'foreground_blk'))
+
+    self.put_runs(runs)
+
+
+  def put_merged(self, chunks, merged):
+    # render the (t_ns, bytes) chunks of the open port and the
+    # (t_ns, name, bytes) chunks of the monitored ports in arrival order
+    i = 0
+    runs = []
+    for t_ns, name, bytes_val in merged:
+      j = i
+      while j < len(chunks) and chunks[j][0] <= t_ns:
+        j += 1
+      if j > i:
+        self.put_runs(runs)
+        runs = []
+        self.put_rx(chunks[i:j])
+        i = j
+      text = self.monitor_text(name, t_ns, bytes_val)
+      if text:
+        runs.append((text, 'foreground_mon'))
+    self.put_runs(runs)
+    if i < len(chunks):
+      self.put_rx(chunks[i:])
+
+
+  def monitor_text(self, name, t_ns, bytes_val):
+    # a chunk of monitored port name as hexdump rows or its completed
+    # lines, each prefixed with the name
     if self.view.view_var.get() == 'va_hex':
-      self.view.put_line(hex_dump(bytes_val), tag)
+      return self.monitor_rows(name, self.monitor_dumps[name].feed(bytes_val))
+    framer = self.monitors[name]
+    lines = framer.feed(bytes_val)
+    if not lines:
+      return ''
+    times = self.frame_times(framer, t_ns, self.session.terms[name].char_time())
+    return ''.join(['[%s] %s' % (name, text) for text in self.text_lines(lines, times)])
+
+
+  def monitor_rows(self, name, text):
+    # hexdump rows of monitored port name, the offsets run on across chunks
+    return ''.join(['[%s] %s' % (name, row) for row in text.splitlines(True)])
+
+
+  def pooled(self):
+    # the pool formats delimited frames and the ascii view. the raw hexdump
+    # is cheaper in-process than its text is to pass back, length prefixed
+    # frames can't be cut into blocks without the framer state. monitored
+    # ports are interleaved in-process.
+    if self.pool is None or self.session:
+      return False
+    if self.framer is None:
+      return self.view.view_var.get() != 'va_hex'
+    return isinstance(self.framer, DelimiterFramer)
+
+
+  def submit_rx(self, chunks):
+    # hand a list of received (t_ns, bytes) chunks to the pool as a block
+    # of whole frames, a partial frame waits for more data
+    bytes_val = b''.join([c for _, c in chunks])
+    framer = self.framer or self.rx_lines
+    buf = self.carry + bytes_val
+    self.rx_index.append(bytes_val)
+    cut = buf.rfind(framer.delimiter)
+    cut = cut + len(framer.delimiter) if cut >= 0 else 0
+    if not cut and len(buf) > framer.max_size:
+      cut = len(buf)
+    self.carry = buf[cut:]
+    if not cut:
+      return
+
+    marks = []
+    end = len(buf) - len(bytes_val)
+    for t_ns, c in chunks:
+      end += len(c)
+      marks.append((end, t_ns))
+    spec = {'framer': self.framer_name if self.framer else 'line',
+            'hex': self.view.view_var.get() == 'va_hex',
+            'check': self.rx_check.name if self.rx_check and self.framer else None,
+            'time': (self.timecode.resolution, self.timecode.offset) if self.time_active else None,
+            'char_ns': self.term.char_time()}
+    self.pool.submit(buf[:cut], marks, spec, (self.rx_index.end - len(buf), chunks[0][0]))
+
+
+  def render_block(self, meta, result):
+    # insert a block formatted by the pool, see submit_rx()
+    start, t_ns = meta
+    runs, ends, lines, bad, errors = result
+    self.lag_ns = time.monotonic_ns() - t_ns
+    self.run_line = self.view.end_line
+    self.anchor_frames([start + e for e in ends], lines)
+    self.rx_frames += len(ends)
+    self.bad_frames += bad
+    self.pool_errors += errors
+    self.put_runs(runs)
+
+
+  def drain_pool(self):
+    # wait for and insert all blocks in the pool
+    if self.pool:
+      for meta, result in self.pool.results(True):
+        self.render_block(meta, result)
+
+
+  def start_pool(self, workers=None):
+    # format received data in worker processes, see pipeline.py
+    self.pool = FormatPool(workers)
+    self.carry = b''
+
+
+  def stop_pool(self):
+    if self.pool:
+      self.pool.close()
+      self.pool = None
+
+
+  def put_frames(self, frames, tag):
+    # render frames with a single insert
+    if self.view.view_var.get() == 'va_hex':
+      self.view.put_line(''.join([hex_dump(b) for b in frames]), tag)
     else:
-      a = self.line_bytes + bytes_val
-      self.line_bytes = self.part(a, tag)
+      self.view.put_line(self.format_lines([b.rstrip(b'\n') for b in frames]), tag)
 
 
   def on_update(self):
-    try:
-      bytes_val = self.term.rxQ.get_nowait()
-    except queue.Empty:
-      pass
-    else:
-      self.put_line(bytes_val, 'foreground_blk')
-
-
-  def on_echo(self, bytes_val):
-    self.put_line(bytes_val, 'foreground_red')
+    # deliver the model events, drain rxQ within the frame budget and
+    # render it with a single insert, return the delay [ms] until the
+    # next tick.
+    start = time.perf_counter()
+    events = self.events.dispatch()
+    chunks = []
+    cnt = 0
+    deadline = start + self.frame_budget
+    pooled = self.pooled()
+    while cnt < self.frame_bytes and time.perf_counter() < deadline and (not pooled or self.pool.room()):
+      try:
+        item = self.term.rxQ.get_nowait()
+      except queue.Empty:
+        break
+      chunks.append(item)
+      cnt += len(item[1])
+    merged = []
+    while self.session and cnt < self.frame_bytes and time.perf_counter() < deadline:
+      try:
+        item = self.session.rxQ.get_nowait()
+      except queue.Empty:
+        break
+      merged.append(item)
+      cnt += len(item[2])
+
+    if chunks or merged:
+      if pooled:
+        self.submit_rx(chunks)
+      elif merged:
+        self.put_merged(chunks, merged)
+        self.lag_ns = time.monotonic_ns() - min([item[0] for item in chunks[:1] + merged[:1]])
+      else:
+        self.put_rx(chunks)
+        self.lag_ns = time.monotonic_ns() - chunks[0][0]
+      self.term.rx_release()
+      self.tick = self.tick_min
+    elif not (self.pool and self.pool.pending()):
+      # line went idle, show the partial hexdump row
+      self.flush_dump()
+      self.lag_ns = 0
+      self.tick = min(self.tick * 2, self.tick_max)
+    if events:
+      self.tick = self.tick_min
+
+    if self.pool:
+      for meta, result in self.pool.results():
+        self.render_block(meta, result)
+
+    if self.watcher.ports is not self.ports:
+      self.on_ports(self.watcher.ports)
+    if self.link_id is not None and not self.term.connected and time.monotonic() >= self.reconnect_at:
+      self.on_lost()
+
+    backlog = self.term.rxQ.qsize() + (self.session.rxQ.qsize() if self.session else 0)
+    if backlog or self.catching_up:
+      self.catching_up = backlog > 0
+      self.view.busy_var.set('catching up (%d queued)' % backlog if backlog else '')
+
+    now = time.perf_counter()
+    self.tick_time = now - start
+    if now >= self.metrics_next:
+      self.metrics_next = now + self.metrics_interval
+      self.show_metrics()
+      if self.view.toggle_stats.get() and self.term.stats:
+        self.view.set_stats(self.term.stats.report())
+
+    return 1 if self.catching_up else self.tick
+
+
+  def show_metrics(self):
+    # one line summary of the metrics in the status bar
+    m = self.metrics_last = self.metrics.snapshot(self.metrics_last)
+    drop = (m['tx_dropped'] + m['rx_frame_errors'] + m['rx_overflows'] + m['events_dropped'] +
+            m.get('scrollback_dropped', 0))
+    self.view.metrics_var.set(
+      'RX %7.1f kB/s %6.0f fr/s | TX %7.1f kB/s %6.0f fr/s | rxQ %4d | lag %6.1f ms | tick %5.1f ms | bad %d | drop %d' % (
+      m['rx_bytes_rate'] / 1e3, m['rx_frames_rate'], m['tx_bytes_rate'] / 1e3, m['tx_frames_rate'],
+      m['rx_queue'], m['render_lag_seconds'] * 1e3, m['render_tick_seconds'] * 1e3, m['rx_bad_frames'], drop))
+
+
+  def export_metrics(self, path, fmt='json', interval=5.0):
+    # write the metrics to path every interval seconds until stop_metrics()
+    self.exporter = MetricsExporter(self.metrics, path, fmt, interval)
+    self.exporter.start()
+
+
+  def stop_metrics(self):
+    if self.exporter:
+      self.exporter.stop()
+      self.exporter = None
+
+
+  def flush_dump(self):
+    self.drain_pool()
+    if self.rx_dump.pending and self.view.view_var.get() == 'va_hex':
+      self.rx_index.anchor_row(self.rx_index.end - len(self.rx_dump.pending), self.view.end_line,
+                               self.rx_dump.offset % 16)
+      self.view.put_line(self.rx_dump.flush(), 'foreground_blk')
+    for name, dump in self.monitor_dumps.items():
+      if dump.pending and self.view.view_var.get() == 'va_hex':
+        self.view.put_line(self.monitor_rows(name, dump.flush()), 'foreground_mon')
+
+
+  def on_echo(self, frames):
+    # the frames sent since the last tick
+    self.flush_dump()
+    self.put_frames(frames, 'foreground_red')
 
 
   def on_entry(self, entry):
     self.history.add(entry)
     try:
-      self.term.talk(bytes(entry, 'ascii').decode('unicode_escape'))
-    except UnicodeDecodeError as E:
+      self.term.talk_entry(entry)
+    except UnicodeError as E:
       self.on_status(str(E))
 
   def on_entry_up(self):
@@ -268,7 +590,32 @@ class TermPresenter(object):
 
 
   def on_view(self, view_type):
-    pass
+    # a partial frame held back from the pool goes with the next block,
+    # formatted for the new view. the raw hexdump is not pooled, the
+    # partial line is shown as it is in the ascii view it came in.
+    self.drain_pool()
+    if self.carry and not self.pooled():
+      self.run_line = self.view.end_line
+      self.anchor_frames([self.rx_index.end], [1])
+      self.view.put_line(self.format_lines([self.carry]), 'foreground_blk')
+      self.carry = b''
+    if not self.carry:
+      self.frame_start = self.rx_index.end
+
+
+  def on_frame(self, name):
+    self.flush_dump()
+    self.framer = FRAMERS[name]() if name != 'raw' else None
+    self.framer_name = name
+    if self.term.stats:
+      self.term.stats.set_framer(FRAMERS[name]() if name != 'raw' else None)
+    self.carry = b''
+    self.frame_start = self.rx_index.end
+
+
+  def on_check(self, name):
+    self.rx_check = CHECKSUMS.get(name)
+    self.bad_frames = 0
 
 
   def on_lf(self, enabled):
@@ -292,64 +639,212 @@ class TermPresenter(object):
         self.term.settings['databits'] = self.view.bits_set.get()
         self.term.settings['parity'] = self.view.pary_set.get()
         self.term.settings['stopbits'] = self.view.stop_set.get()
+        self.term.settings['flow'] = self.view.flow_set.get()
 
+        self.reset_rx()
         if not self.term.connect():
           self.view.toggle_open.set(False)
         else:
           self.set_cfg_enabled(False)
+          self.link_id = self.watcher.id_of(self.term.settings['device'])
+          self.lost = False
       else:
-        self.term.disconnect()
+        self.link_id = None
+        # close first, stopping the writer releases a repeater waiting
+        # on a TX queue that CTS or XOFF holds
+        if not self.lost:
+          self.term.disconnect()
+        self.stop_rep()
         self.set_cfg_enabled(True)
 
       self.active = True
 
 
-  def on_mod(self, enable):
+  def reset_rx(self):
+    # a new connection starts a new stream
+    self.rx_dump.reset()
+    self.rx_lines.reset()
+    if self.framer:
+      self.framer.reset()
+    self.drain_pool()
+    self.carry = b''
+    self.frame_start = self.rx_index.end
+
+
+  def stop_rep(self):
+    if self.rep_active:
+      self.rep_active = False
+      self.generator.stop()
+      self.view.toggle_rep.set(False)
+
+
+  def on_ports(self, ports):
+    # the port list changed, the selection is kept
+    self.ports = ports
+    devices = [p.device for p in ports]
+    self.term.options['device'] = devices
+    self.view.cfg['port'].config(values=devices)
+    if not self.view.port_set.get() and devices:
+      self.view.port_set.set(devices[0])
+
+
+  def on_lost(self):
+    # the open port went away without the user closing it, e.g. a USB
+    # adapter unplugged or reset. reopen it once it is back, under the
+    # name it re-enumerated with.
+    self.reconnect_at = time.monotonic() + self.reconnect_interval
+    if not self.lost:
+      self.lost = True
+      self.term.disconnect()
+      self.stop_rep()
+      self.on_status('Lost %s, reconnecting when it is back.' % self.term.settings['device'])
+
+    device = self.watcher.find(self.link_id)
+    if device is None:
+      return
+    self.term.settings['device'] = device
+    self.view.port_set.set(device)
+    self.reset_rx()
+    # a failed attempt would post its error every reconnect_interval
+    self.reconnecting = True
+    try:
+      connected = self.term.connect()
+    finally:
+      self.reconnecting = False
+    if connected:
+      self.lost = False
+      self.on_status('Reconnected to %s.' % device)
+
+
+  def on_sum(self, name):
+    # checksum appended to TX frames, the mod and xor toggles follow it
+    self.term.sum_type = name if name in CHECKSUMS else None
     if self.active:
-      if enable:
-        self.active = False
-        self.view.toggle_xor.set(False)
-        self.active = True
-        self.term.sum_type = 'mod'
-      else:
-        self.term.sum_type = None
+      self.active = False
+      self.view.sum_set.set(name)
+      self.view.toggle_mod.set(name == 'mod')
+      self.view.toggle_xor.set(name == 'xor')
+      self.active = True
 
 
-  def _repeater(self):
-    while self.rep_active:
-      self.term.talk(bytes(self.history.history[-1], 'ascii').decode('unicode_escape'))
-      time.sleep(1)
+  def on_mod(self, enable):
+    if self.active:
+      self.on_sum('mod' if enable else 'none')
 
 
   def on_xor(self, enable):
     if self.active:
-      if enable:
-        self.active = False
-        self.view.toggle_mod.set(False)
-        self.active = True
-        self.term.sum_type = 'xor'
-      else:
-        self.term.sum_type = None
+      self.on_sum('xor' if enable else 'none')
 
 
   def on_rep(self, enable):
+    # repeat the last entry at the rate set in the view, the frame is
+    # encoded once up front
     if self.active:
       if enable:
-        self.rep_thd = threading.Thread(target=self._repeater)
-        self.rep_thd.setDaemon(True)
-        self.rep_active =  True
-        self.rep_thd.start()
-      else:
+        if not self.term.connected:
+          self.on_status('Not connected.')
+          self.view.toggle_rep.set(False)
+          return
+        try:
+          frame = self.term.compile(self.history.history[-1])
+        except UnicodeError as E:
+          self.on_status(str(E))
+          self.view.toggle_rep.set(False)
+          return
+        entry = self.view.rate_set.get()
+        try:
+          rate = 0 if entry == 'max' else float(entry)
+        except ValueError:
+          rate = None
+        # 'max' is line rate, a rate entered must be positive
+        if rate is None or (entry != 'max' and not rate > 0):
+          self.on_status('Invalid repeat rate %s.' % entry)
+          self.view.toggle_rep.set(False)
+          return
+        # the generator waits for room in the TX queue instead of dropping,
+        # in bounded steps so it notices being stopped
+        self.generator = TrafficGenerator(lambda b: self.term.send(b, True, self.rep_wait), [frame], rate)
+        self.generator.start()
+        self.rep_active = True
+      elif self.rep_active:
         self.rep_active = False
-        self.rep_thd.join()
+        self.generator.stop()
+        self.on_status('Repeater %s' % self.generator.report())
+
+
+  def start_stats(self):
+    # feed the received stream to a LinkStats from now on, returns it
+    if self.term.stats is None:
+      stats = LinkStats()
+      stats.set_framer(FRAMERS[self.framer_name]() if self.framer else None)
+      stats.restart(self.term.char_time())
+      self.term.stats = stats
+    return self.term.stats
+
+
+  def on_stats(self, enable):
+    # show the link statistics next to the terminal window, they are only
+    # collected while shown unless keep_stats is set
+    self.view.show_stats(enable)
+    if enable:
+      self.view.set_stats(self.start_stats().report())
+    elif not self.keep_stats:
+      self.term.stats = None
 
 
   def on_time(self, enable):
     self.time_active = enable
 
 
+  def on_time_res(self, resolution):
+    self.timecode.resolution = resolution
+
+
   def on_clr(self):
-    self.view.output_text.delete(1.0, tk.END)
+    # the scrollback restarts its line numbers, so does the index. the
+    # bytes not shown yet stay in it, offsets are counted back from its end.
+    self.view.clear()
+    held = [self.rx_dump.pending, self.rx_lines.buf, self.carry]
+    if self.framer:
+      held.append(self.framer.buf)
+    keep = min(max([len(b) for b in held]), len(self.rx_index.buf))
+    tail = bytes(self.rx_index.buf[len(self.rx_index.buf) - keep:])
+    self.rx_index.clear()
+    self.rx_index.append(tail)
+    self.frame_start = 0
+    self.search = None
+    self.search_query = None
+    self.view.search_info.set('')
+
+
+  def on_search(self, query, kind, step=1):
+    # jump to the next match of query in the received stream, or the
+    # previous one with step -1. a changed query starts a new search.
+    if (query, kind) != self.search_query:
+      try:
+        self.search = Search(self.rx_index, compile_query(query, kind))
+      except ValueError as E:
+        self.view.search_info.set(str(E))
+        return
+      self.search_query = (query, kind)
+      self.match = None
+
+    n = self.search.update()
+    if not n:
+      self.view.mark([])
+      self.view.search_info.set('no match')
+      return
+
+    if self.match is None or self.match >= n:
+      self.match = 0 if step > 0 else n - 1
+    else:
+      self.match = (self.match + step) % n
+    start, end = self.search.starts[self.match], self.search.ends[self.match]
+    spans = self.rx_index.spans(start, end - start)
+    self.view.mark(spans)
+    self.view.search_info.set('%d/%d%s' % (self.match + 1, n, '' if spans and self.view.has_line(spans[0][0])
+                                                            else ' (not in scrollback)'))
 
   def on_cmd(self):
     self.pv = PresetGUI()
@@ -371,14 +866,21 @@ class TermInteractor(object):
     # buttons
     view.clr_btn.config(command=self.on_clr)
     view.cmd_btn.config(command=self.on_cmd)
+    view.prev_btn.config(command=self.on_search_prev)
+    view.next_btn.config(command=self.on_search_next)
 
     # key bindings
     view.entry.bind('<Key-Return>', self.on_enter)
     view.entry.bind('<Key-Up>', self.on_up)
     view.entry.bind('<Key-Down>', self.on_down)
+    view.search_entry.bind('<Key-Return>', self.on_search_next)
+    view.search_entry.bind('<Shift-Return>', self.on_search_prev)
 
     # variable bindings
     view.view_var.trace('w', self.on_view)
+    view.frame_set.trace('w', self.on_frame)
+    view.check_set.trace('w', self.on_check)
+    view.sum_set.trace('w', self.on_sum)
     view.toggle_lf.trace('w', self.on_lf)
     view.toggle_cr.trace('w', self.on_cr)
     view.toggle_echo.trace('w', self.on_echo)
@@ -387,14 +889,15 @@ class TermInteractor(object):
     view.toggle_xor.trace('w', self.on_xor)
     view.toggle_rep.trace('w', self.on_rep)
     view.toggle_time.trace('w', self.on_time)
+    view.toggle_stats.trace('w', self.on_stats)
+    view.res_set.trace('w', self.on_time_res)
 
     # start update loop
     self.on_update()
 
 
   def on_update(self):
-    self.presenter.on_update()
-    self.view.after(10, self.on_update)
+    self.view.after(self.presenter.on_update(), self.on_update)
 
   def on_enter(self, *args):
     self.presenter.on_entry(self.view.entry.get())
@@ -409,6 +912,15 @@ class TermInteractor(object):
   def on_view(self, *args):
     self.presenter.on_view(self.view.view_var.get())
 
+  def on_frame(self, *args):
+    self.presenter.on_frame(self.view.frame_set.get())
+
+  def on_check(self, *args):
+    self.presenter.on_check(self.view.check_set.get())
+
+  def on_sum(self, *args):
+    self.presenter.on_sum(self.view.sum_set.get())
+
   def on_lf(self, *args):
     self.presenter.on_lf(self.view.toggle_lf.get())
 
@@ -433,15 +945,91 @@ class TermInteractor(object):
   def on_time(self, *args):
     self.presenter.on_time(self.view.toggle_time.get())
 
+  def on_stats(self, *args):
+    self.presenter.on_stats(self.view.toggle_stats.get())
+
+  def on_time_res(self, *args):
+    self.presenter.on_time_res(self.view.res_set.get())
+
   def on_clr(self, *args):
     self.presenter.on_clr()
 
+  def on_search_next(self, *args):
+    self.presenter.on_search(self.view.search_var.get(), self.view.search_kind.get(), 1)
+
+  def on_search_prev(self, *args):
+    self.presenter.on_search(self.view.search_var.get(), self.view.search_kind.get(), -1)
+
   def on_cmd(self, *args):
     self.presenter.on_cmd()
 
 
-def main():
-  TermPresenter(Terminal(), TermView(), TermInteractor()).run(title='KE Software Bt3 Serial Terminal v1.0')
+def main(argv=None):
+  p = argparse.ArgumentParser(description='Bt3 serial terminal.')
+  p.add_argument('--async', dest='use_async', action='store_true', help='run on the asyncio terminal core')
+  p.add_argument('--on', nargs=2, action='append', default=[], metavar=('PATTERN', 'RESPONSE'),
+                 help='send the escaped RESPONSE as soon as the escaped PATTERN is received, repeatable')
+  p.add_argument('--metrics', metavar='PATH', help='export the runtime metrics to PATH')
+  p.add_argument('--metrics-format', choices=['json', 'prom'], default='json',
+                 help='json or Prometheus text format (default json)')
+  p.add_argument('--metrics-interval', type=float, default=5.0, help='export interval in seconds (default 5)')
+  p.add_argument('--workers', type=int, default=0, metavar='N',
+                 help='format received data in N worker processes, for multi-megabaud rates')
+  p.add_argument('--stats', metavar='PATH', help='write the link statistics to PATH as JSON on exit')
+  p.add_argument('-c', '--capture', metavar='PATH', help='record RX and TX to this binary capture')
+  p.add_argument('--bridge', metavar='[HOST:]PORT',
+                 help='share the port with TCP clients on PORT, local only unless HOST is given')
+  p.add_argument('--rfc2217', action='store_true', help='bridge clients speak RFC 2217 instead of raw TCP')
+  p.add_argument('--bridge-settings', action='store_true', help='let RFC 2217 clients change the port settings')
+  p.add_argument('--bridge-read-only', action='store_true', help='ignore what bridge clients send')
+  p.add_argument('--monitor', action='append', default=[],
+                 metavar='DEVICE[,speed=..,databits=..,parity=..,stopbits=..,flow=..]',
+                 help='also show this port read-only, interleaved by arrival time, repeatable')
+  args = p.parse_args(argv)
+
+  if args.use_async:
+    from aterminal import TerminalBridge   # asyncio is only imported when used
+    term = TerminalBridge()
+  else:
+    term = Terminal()
+  capture = CaptureWriter(args.capture) if args.capture else None
+  term.capture = capture
+  if args.on:
+    term.responder = Responder(term.respond)
+    for pattern, response in args.on:
+      term.responder.add(unescape(pattern), unescape(response), pattern)
+  if args.bridge:
+    host, port = parse_address(args.bridge)
+    try:
+      term.bridge = Bridge(term, host, port, args.rfc2217, allow_tx=not args.bridge_read_only,
+                           allow_settings=args.bridge_settings)
+    except OSError as ex:
+      p.error('--bridge %s: %s' % (args.bridge, ex))
+    term.bridge.start()
+  presenter = TermPresenter(term, TermView(), TermInteractor())
+  if args.stats:
+    presenter.keep_stats = True
+    presenter.start_stats()
+  for spec in args.monitor:
+    device, opts = parse_spec(spec)
+    presenter.add_monitor(device, port_settings(opts, term.settings)).capture = capture
+  if args.metrics:
+    presenter.export_metrics(args.metrics, args.metrics_format, args.metrics_interval)
+  if args.workers:
+    presenter.start_pool(args.workers)
+  presenter.run(title='KE Software Bt3 Serial Terminal v1.0')
+  presenter.stop_pool()
+  presenter.stop_metrics()
+  # the receiving thread feeds the stats and the bridge until the port is closed
+  if term.connected:
+    term.disconnect()
+  if args.stats:
+    term.stats.save(args.stats)
+  if term.bridge:
+    term.bridge.stop()
+    term.bridge = None
+  if capture:
+    capture.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,367 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# bt3cli.py     headless capture mode of Bt3
+#
+# Runs the Terminal model without Tk. RX is written to stdout or a file as
+# hexdump, ASCII lines or raw bytes. TX lines are escaped strings like the
+# ones typed into the entry of the GUI, read from stdin or a script file.
+#
+# usage: python bt3cli.py -d /dev/ttyUSB0 -s 921600 -f hex -o capture.txt
+#
+
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+
+from terminal import Terminal
+from session import Session, parse_spec, port_settings
+from support import HexDumper, Timecode, hex_dump, unescape
+from framing import FRAMERS, DelimiterFramer
+from checksum import CHECKSUMS
+from capture import CaptureWriter
+from generator import TrafficGenerator
+from triggers import Responder
+from ring import RxRing, OVERFLOW
+from discovery import PortWatcher
+from metrics import Metrics, MetricsExporter, terminal_metrics, COUNTER
+from bridge import Bridge, parse_address
+from linkstats import LinkStats
+
+
+class RxWriter(object):
+  # formats received chunks for the output stream, with timecode set
+  # lines and frames are stamped with their interpolated arrival time
+  def __init__(self, out, fmt, framer=None, check=None, timecode=None, char_ns=0):
+    self.out = out
+    self.fmt = fmt
+    self.check = check
+    self.timecode = timecode
+    self.char_ns = char_ns
+    self.bad_frames = 0
+    self.dump = HexDumper()
+    self.lines = DelimiterFramer(b'\n', strip=True)
+    self.framer = framer
+
+  def stamp(self, framer, t_ns):
+    # yield the timecode prefix of each frame framer just completed
+    end = framer.offset + len(framer.buf)
+    for e in framer.ends:
+      yield b'%s ' % self.timecode.format(t_ns - (end - e) * self.char_ns).encode('ascii') if self.timecode else b''
+
+  def write(self, bytes_val, t_ns):
+    if self.fmt == 'raw':
+      self.out.write(bytes_val)
+    elif self.framer:
+      frames = self.framer.feed(bytes_val)
+      for frame, tc in zip(frames, self.stamp(self.framer, t_ns)):
+        if self.check and not self.check.verify(frame):
+          self.bad_frames += 1
+          self.out.write(b'#BAD %s\n' % self.check.name.encode('ascii'))
+        if self.fmt == 'hex':
+          self.out.write(tc.rstrip() + b'\n' if tc else b'')
+          self.out.write(hex_dump(frame).encode('ascii'))
+        else:
+          self.out.write(tc + frame.decode('ascii', errors='ignore').encode('ascii') + b'\n')
+    elif self.fmt == 'hex':
+      self.out.write(self.dump.feed(bytes_val).encode('ascii'))
+    else:
+      lines = self.lines.feed(bytes_val)
+      for line, tc in zip(lines, self.stamp(self.lines, t_ns)):
+        self.out.write(tc + line.decode('ascii', errors='ignore').encode('ascii') + b'\n')
+
+  def flush(self):
+    # called when the line is idle
+    if self.fmt == 'hex' and self.dump.pending:
+      self.out.write(self.dump.flush().encode('ascii'))
+    self.out.flush()
+
+
+def sender(term, src, delay):
+  # transmit escaped lines from src, an empty line just waits
+  for entry in src:
+    entry = entry.rstrip('\r\n')
+    if entry:
+      try:
+        term.talk_entry(entry, True)
+      except UnicodeError as ex:
+        term.status.set(str(ex))
+    time.sleep(delay)
+
+
+def generate(term, src, args):
+  # send the escaped lines of src as a rotating frame list at args.rate
+  try:
+    frames = [term.compile(entry.rstrip('\r\n')) for entry in src if entry.strip()]
+  except UnicodeError as ex:
+    term.status.set(str(ex))
+    return
+  if frames:
+    gen = TrafficGenerator(lambda b: term.send(b, True), frames, args.rate, args.burst, args.count)
+    gen.run()
+    print('#GENERATOR: %s' % gen.report(), file=sys.stderr)
+
+
+def port_spec(spec, args):
+  # DEVICE[,key=value...] -> (device, settings, options), unset keys come from args
+  device, opts = parse_spec(spec)
+  options = {key: opts.get(key, getattr(args, key)) for key in ['sum', 'check', 'frame']}
+  return device, port_settings(opts, vars(args)), options
+
+
+class Prefixed(object):
+  # output stream putting a port label in front of every line
+  def __init__(self, out, label):
+    self.out = out
+    self.label = label
+
+  def write(self, bytes_val):
+    self.out.write(b''.join([self.label + line for line in bytes_val.splitlines(True)]))
+
+  def flush(self):
+    self.out.flush()
+
+
+def parse_args(argv, term):
+  p = argparse.ArgumentParser(description='Bt3 headless serial capture.')
+  p.add_argument('-d', '--device', action='append',
+                 help='DEVICE[,speed=..,databits=..,parity=..,stopbits=..,flow=..,sum=..,check=..,frame=..], '
+                      'repeat for more ports')
+  p.add_argument('-s', '--speed', type=int, default=term.settings['speed'])
+  p.add_argument('--databits', type=int, default=term.settings['databits'], choices=term.options['databits'])
+  p.add_argument('--parity', default=term.settings['parity'], choices=term.options['parity'])
+  p.add_argument('--stopbits', type=float, default=term.settings['stopbits'], choices=term.options['stopbits'])
+  p.add_argument('--flow', default=term.settings['flow'], choices=term.options['flow'])
+  p.add_argument('-f', '--format', default='hex', choices=['hex', 'ascii', 'raw'])
+  p.add_argument('--frame', default='raw', choices=list(FRAMERS), help='framing of the hex and ascii output')
+  p.add_argument('--time', choices=list(Timecode.RESOLUTIONS), help='stamp lines and frames with their arrival time')
+  p.add_argument('-o', '--output', help='write RX to this file instead of stdout')
+  p.add_argument('--split', action='store_true', help='with several ports, write each to OUTPUT.<n> instead of interleaving')
+  p.add_argument('-c', '--capture', help='also record RX and TX to this binary capture')
+  p.add_argument('-t', '--script', help='transmit the lines of this file instead of stdin, to the first port')
+  p.add_argument('--no-stdin', action='store_true', help='do not transmit from stdin')
+  p.add_argument('--delay', type=float, default=0.0, help='seconds between transmitted lines')
+  p.add_argument('--char-gap', type=float, default=0.0, help='ms between transmitted characters')
+  p.add_argument('--frame-gap', type=float, default=0.0, help='ms between transmitted frames')
+  p.add_argument('--rate', type=float, help='send the TX lines as a rotating frame list at this rate [Hz], 0 for line rate')
+  p.add_argument('--burst', type=int, default=1, help='frames per period with --rate')
+  p.add_argument('--count', type=int, help='stop the --rate generator after this many frames')
+  p.add_argument('--duration', type=float, help='stop after this many seconds')
+  p.add_argument('--sum', choices=list(CHECKSUMS), help='append a checksum to each frame')
+  p.add_argument('--check', choices=list(CHECKSUMS), help='flag received frames failing this checksum, needs --frame')
+  p.add_argument('--cr', action='store_true', help='append CR to each frame')
+  p.add_argument('--lf', action='store_true', help='append LF to each frame')
+  p.add_argument('--rx-buffer', type=int, help='receive buffer in KB (default 4096), single port only')
+  p.add_argument('--overflow', choices=OVERFLOW,
+                 help='when the receive buffer is full: block the port (default), drop the oldest data or spill it '
+                      'to --spill, single port only')
+  p.add_argument('--spill', metavar='PATH', help='file the oldest data goes to with --overflow spill')
+  p.add_argument('--on', nargs=2, action='append', default=[], metavar=('PATTERN', 'RESPONSE'),
+                 help='send the escaped RESPONSE as soon as the escaped PATTERN is received, repeatable')
+  p.add_argument('--metrics', metavar='PATH', help='export the runtime metrics to PATH')
+  p.add_argument('--metrics-format', choices=['json', 'prom'], default='json',
+                 help='json or Prometheus text format (default json)')
+  p.add_argument('--metrics-interval', type=float, default=5.0, help='export interval in seconds (default 5)')
+  p.add_argument('--stats', metavar='PATH', help='write the link statistics of each port to PATH as JSON on exit')
+  p.add_argument('--bridge', metavar='[HOST:]PORT',
+                 help='share the port with TCP clients on PORT, local only unless HOST is given')
+  p.add_argument('--rfc2217', action='store_true', help='bridge clients speak RFC 2217 instead of raw TCP')
+  p.add_argument('--bridge-settings', action='store_true', help='let RFC 2217 clients change the port settings')
+  p.add_argument('--bridge-read-only', action='store_true', help='ignore what bridge clients send')
+  args = p.parse_args(argv)
+  if args.rate is not None and args.rate < 0:
+    p.error('--rate must not be negative')
+  if args.overflow == 'spill' and not args.spill:
+    p.error('--overflow spill needs --spill')
+  if not args.device:
+    watcher = PortWatcher()
+    watcher.scan()
+    if not watcher.devices:
+      p.error('no serial port found, use -d')
+    args.device = watcher.devices[:1]
+  if len(args.device) > 1 and args.split and not args.output:
+    p.error('--split needs --output')
+  if len(args.device) > 1 and args.format == 'raw' and not args.split:
+    p.error('raw output of several ports needs --split')
+  if len(args.device) > 1 and args.bridge:
+    p.error('--bridge shares a single port')
+  if len(args.device) > 1 and (args.rx_buffer is not None or args.overflow or args.spill):
+    # the ports of a session share one unbounded queue, see session.py
+    p.error('--rx-buffer, --overflow and --spill apply to a single port')
+  if args.rx_buffer is None:
+    args.rx_buffer = 4096
+  if args.overflow is None:
+    args.overflow = 'block'
+  return args
+
+
+def main(argv=None):
+  term = Terminal()
+  args = parse_args(argv, term)
+  bridge = None
+  if args.bridge:
+    host, port = parse_address(args.bridge)
+    try:
+      bridge = Bridge(term, host, port, args.rfc2217, allow_tx=not args.bridge_read_only,
+                      allow_settings=args.bridge_settings)
+    except OSError as ex:
+      print('#BRIDGE: %s' % ex, file=sys.stderr)
+      return 1
+    term.bridge = bridge
+    bridge.start()
+  capture = CaptureWriter(args.capture) if args.capture else None
+  session = Session() if len(args.device) > 1 else None
+  metrics = Metrics() if args.metrics else None
+
+  terms = []
+  writers = {}
+  outs = []
+  for n, spec in enumerate(args.device):
+    device, settings, options = port_spec(spec, args)
+    if session:
+      term = session.add(device, settings)
+    else:
+      term.settings['device'] = device
+      term.settings.update(settings)
+      term.rxQ = RxRing(args.rx_buffer * 1024, args.overflow, args.spill)
+    term.sum_type = options['sum'] or ''
+    term.cr_enable = args.cr
+    term.lf_enable = args.lf
+    term.echo_enable = False
+    term.char_gap = args.char_gap / 1000.0
+    term.frame_gap = args.frame_gap / 1000.0
+    term.capture = capture
+    if args.stats:
+      term.stats = LinkStats()
+      term.stats.set_framer(FRAMERS[options['frame']]() if options['frame'] != 'raw' else None)
+    if args.on:
+      term.responder = Responder(term.respond)
+      for pattern, response in args.on:
+        term.responder.add(unescape(pattern), unescape(response), pattern)
+    term.status.addCallback(lambda status, d=device: print('#STATUS %s: %s' % (d, status), file=sys.stderr))
+    terms.append(term)
+
+    if not args.output:
+      out = sys.stdout.buffer
+    elif args.split:
+      out = open('%s.%d' % (args.output, n), 'wb')
+    elif not outs:
+      out = open(args.output, 'wb')
+    else:
+      out = outs[0]
+    if out not in outs:
+      outs.append(out)
+    if session and not args.split:
+      out = Prefixed(out, b'[%s] ' % device.encode('utf-8'))
+
+    rx = writers[device if session else None] = RxWriter(out, args.format,
+                                                         FRAMERS[options['frame']]() if options['frame'] != 'raw' else None,
+                                                         CHECKSUMS.get(options['check']),
+                                                         Timecode(args.time) if args.time else None,
+                                                         term.char_time())
+    if metrics:
+      name = 'port%d' % n if session else ''
+      terminal_metrics(metrics, term, name)
+      metrics.add((name + '_' if name else '') + 'rx_bad_frames', lambda rx=rx: rx.bad_frames, COUNTER,
+                  'frames failing the RX checksum')
+
+  exporter = MetricsExporter(metrics, args.metrics, args.metrics_format, args.metrics_interval) if metrics else None
+
+  def close():
+    if args.stats:
+      with open(args.stats, 'w') as f:
+        json.dump({'time': time.time(), 'links': {t.settings['device']: t.stats.snapshot() for t in terms}},
+                  f, sort_keys=True)
+    if bridge:
+      print('#BRIDGE: %s' % bridge.report(), file=sys.stderr)
+      bridge.stop()
+    if exporter:
+      exporter.stop()
+    for out in outs:
+      if out is not sys.stdout.buffer:
+        out.close()
+    if capture:
+      capture.close()
+
+  connected = session.connect() if session else term.connect()
+  if not connected:
+    if session:
+      session.disconnect()
+    close()
+    return 1
+
+  if exporter:
+    exporter.start()
+
+  src = open(args.script) if args.script else (None if args.no_stdin else sys.stdin)
+  if src:
+    if args.rate is not None:
+      tx_thd = threading.Thread(target=generate, args=(terms[0], src, args))
+    else:
+      tx_thd = threading.Thread(target=sender, args=(terms[0], src, args.delay))
+    tx_thd.daemon = True
+    tx_thd.start()
+
+  def receive(block):
+    # write one chunk from the receive queue, raises queue.Empty
+    if session:
+      t_ns, name, bytes_val = session.rxQ.get(block, 0.1)
+      writers[name].write(bytes_val, t_ns)
+    else:
+      t_ns, bytes_val = term.rxQ.get(block, 0.1)
+      writers[None].write(bytes_val, t_ns)
+      term.rx_release()
+
+  link = session or term
+  end = time.monotonic() + args.duration if args.duration else None
+  try:
+    while link.connected and (end is None or time.monotonic() < end):
+      try:
+        receive(True)
+      except queue.Empty:
+        for rx in writers.values():
+          rx.flush()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    try:
+      while True:
+        receive(False)
+    except queue.Empty:
+      pass
+    for rx in writers.values():
+      rx.flush()
+    # also after a read error closed the link, to stop the writer and
+    # report what was sent and received
+    if session:
+      session.disconnect()
+    elif term.is_open:
+      term.disconnect()
+    close()
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,194 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# capture.py     indexed binary capture log of Bt3
+#
+# A capture is a file with a header followed by records:
+#
+#   header  '<8sqq'   magic, wall clock ns and monotonic ns at creation
+#   record  '<QIHBx'  monotonic ns, payload length, port id, direction
+#           payload
+#
+# Direction is RX, TX or PORT. A PORT record names a port id, its payload
+# is the device name. Next to the capture a sparse index '<path>.idx' holds
+# '<QQ' (monotonic ns, file offset) pairs every index_every bytes, so a
+# reader can bisect to a point in time and scan only a short stretch. Every
+# PORT record is indexed too, a reader finds the ports without a full scan.
+#
+
+import os
+import mmap
+import time
+import struct
+import bisect
+import threading
+
+MAGIC = b'BT3CAP\x00\x01'
+HEADER = struct.Struct('<8sqq')
+RECORD = struct.Struct('<QIHBx')
+INDEX = struct.Struct('<QQ')
+
+RX = 0
+TX = 1
+PORT = 2
+
+
+class CaptureWriter(object):
+  """CaptureWriter - Appends records to a capture and its index.
+
+     write() is thread safe, the listener and the sender share a writer.
+     Records are written in stamp order, a stamp taken before the lock
+     that is older than the last record is raised to its stamp.
+  """
+  def __init__(self, path, index_every=65536):
+    self.path = path
+    self.index_every = index_every
+    self.ports = {}
+    self._lock = threading.Lock()
+    self._file = open(path, 'wb')
+    self._idx = open(path + '.idx', 'wb')
+    self._file.write(HEADER.pack(MAGIC, time.time_ns(), time.monotonic_ns()))
+    self._offset = HEADER.size
+    self._next_index = self._offset
+    self._last_ns = 0
+
+  def port_id(self, name):
+    """Return the id of port name, registering it on first use."""
+    with self._lock:
+      if name not in self.ports:
+        self.ports[name] = len(self.ports)
+        self._append(time.monotonic_ns(), PORT, self.ports[name], name.encode('utf-8'))
+      return self.ports[name]
+
+  def write(self, direction, port, bytes_val, t_ns=None):
+    """Append bytes_val, stamped with t_ns or the current monotonic time."""
+    with self._lock:
+      self._append(max(t_ns or time.monotonic_ns(), self._last_ns), direction, port, bytes_val)
+
+  def flush(self):
+    with self._lock:
+      self._file.flush()
+      self._idx.flush()
+
+  def close(self):
+    with self._lock:
+      self._file.close()
+      self._idx.close()
+
+  def _append(self, t_ns, direction, port, bytes_val):
+    self._last_ns = t_ns
+    if self._offset >= self._next_index or direction == PORT:
+      self._idx.write(INDEX.pack(t_ns, self._offset))
+      self._next_index = self._offset + self.index_every
+    self._file.write(RECORD.pack(t_ns, len(bytes_val), port, direction))
+    self._file.write(bytes_val)
+    self._offset += RECORD.size + len(bytes_val)
+
+
+class CaptureReader(object):
+  """CaptureReader - Memory mapped access to a capture.
+
+     Records are returned as (offset, t_ns, direction, port, payload) with
+     payload a memoryview into the mapping, nothing is loaded up front.
+  """
+  def __init__(self, path):
+    self.path = path
+    self._file = open(path, 'rb')
+    self.size = os.fstat(self._file.fileno()).st_size
+    self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    self._view = memoryview(self._map)
+
+    magic, self.wall_ns, self.mono_ns = HEADER.unpack_from(self._map, 0)
+    if magic != MAGIC:
+      raise ValueError('%s is not a Bt3 capture' % path)
+
+    self.ports = {}
+    self._load_index()
+    self._load_ports()
+
+  def close(self):
+    self._view.release()
+    self._map.close()
+    self._file.close()
+
+  def records(self, offset=None):
+    """Iterate over the records from offset on, the start by default.
+
+       PORT records passed on the way are added to ports.
+    """
+    offset = offset or HEADER.size
+    while offset + RECORD.size <= self.size:
+      t_ns, cnt, port, direction = RECORD.unpack_from(self._map, offset)
+      start = offset + RECORD.size
+      if start + cnt > self.size:
+        break   # truncated record at the end of a live capture
+      if direction == PORT:
+        self.ports[port] = bytes(self._view[start:start + cnt]).decode('utf-8')
+      yield offset, t_ns, direction, port, self._view[start:start + cnt]
+      offset = start + cnt
+
+  def find(self, t_ns):
+    """Return the offset of the first record stamped t_ns or later."""
+    i = max(0, bisect.bisect_right(self._index_t, t_ns) - 1)
+    start = self._index_off[i] if self._index_off else HEADER.size
+    for offset, rec_ns, _, _, _ in self.records(start):
+      if rec_ns >= t_ns:
+        return offset
+    return self.size
+
+  def wall_time(self, t_ns):
+    """Return the wall clock time in seconds of monotonic t_ns."""
+    return (self.wall_ns + t_ns - self.mono_ns) / 1e9
+
+  def _load_index(self):
+    self._index_t = []
+    self._index_off = []
+    try:
+      with open(self.path + '.idx', 'rb') as f:
+        data = f.read()
+    except OSError:
+      data = b''
+
+    if data:
+      for t_ns, offset in INDEX.iter_unpack(data[:len(data) - len(data) % INDEX.size]):
+        self._index_t.append(t_ns)
+        self._index_off.append(offset)
+    else:
+      # no index, rebuild it in memory with one pass over the headers
+      for offset, t_ns, direction, _, _ in self.records():
+        if not self._index_off or offset - self._index_off[-1] >= 65536 or direction == PORT:
+          self._index_t.append(t_ns)
+          self._index_off.append(offset)
+
+  def _load_ports(self):
+    # the ports registered before the first data, then the indexed ones
+    # registered later on. indexes older than the PORT entries only have
+    # the first ones.
+    for _, _, direction, _, _ in self.records():
+      if direction != PORT:
+        break
+    for offset in self._index_off:
+      if offset + RECORD.size > self.size:
+        break
+      _, cnt, port, direction = RECORD.unpack_from(self._map, offset)
+      start = offset + RECORD.size
+      if direction == PORT and start + cnt <= self.size:
+        self.ports[port] = bytes(self._view[start:start + cnt]).decode('utf-8')
@@ -0,0 +1,191 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# checksum.py     frame checksums of Bt3
+#
+# Every checksum computes over bytes or memoryviews, appends its value to a
+# frame and verifies received frames that end with one. CRCs use 256 entry
+# tables, with numpy the lookups of whole blocks are done at once. The
+# variants the standard library implements in C are handed to binascii.
+#
+
+import binascii
+
+from support import sum_mod, sum_xor, numpy_module
+
+
+class Checksum(object):
+  """Checksum - A checksum of size bytes sent in byteorder after the frame."""
+  def __init__(self, name, size, func, byteorder='big'):
+    self.name = name
+    self.size = size
+    self.func = func
+    self.byteorder = byteorder
+
+  def compute(self, bytes_val):
+    """Return the checksum of bytes_val as an integer."""
+    return self.func(bytes_val)
+
+  def digest(self, bytes_val):
+    """Return the checksum of bytes_val as the bytes to send."""
+    return self.compute(bytes_val).to_bytes(self.size, self.byteorder)
+
+  def verify(self, frame):
+    """Return True if frame ends with the checksum of the bytes before it."""
+    if len(frame) < self.size:
+      return False
+    view = memoryview(frame)
+    return self.compute(view[:-self.size]) == int.from_bytes(view[-self.size:], self.byteorder)
+
+
+class Crc(Checksum):
+  """Crc - Table driven CRC of width 8, 16 or 32 bits.
+
+     The parameters follow the Rocksoft model: poly, init, refin/refout
+     (here one flag, reflected) and xorout. With numpy installed frames
+     of a few blocks or more are looked up BLOCK bytes at a time.
+  """
+  BLOCK = 128         # bytes per numpy lookup, see _crc_blocks()
+
+  def __init__(self, name, width, poly, init=0, reflected=False, xorout=0, byteorder='big'):
+    Checksum.__init__(self, name, width // 8, self._crc, byteorder)
+    self.width = width
+    self.poly = poly
+    self.init = init
+    self.reflected = reflected
+    self.xorout = xorout
+    self.table = self._make_table()
+    self.block_tables = None     # numpy tables of BLOCK bytes, made on first use
+
+  def _make_table(self):
+    mask = (1 << self.width) - 1
+    table = []
+    poly = int('{:0{w}b}'.format(self.poly, w=self.width)[::-1], 2)
+    for n in range(256):
+      if self.reflected:
+        c = n
+        for _ in range(8):
+          c = (c >> 1) ^ poly if c & 1 else c >> 1
+      else:
+        top = 1 << (self.width - 1)
+        c = n << (self.width - 8)
+        for _ in range(8):
+          c = ((c << 1) ^ self.poly) if c & top else c << 1
+      table.append(c & mask)
+    return table
+
+  def _crc(self, bytes_val):
+    if len(bytes_val) >= 2 * self.BLOCK and numpy_module() is not None:
+      crc = self._crc_blocks(self.init, bytes_val)
+    else:
+      crc = self._crc_bytes(self.init, bytes_val)
+    return crc ^ self.xorout
+
+  def _crc_bytes(self, crc, bytes_val):
+    # the register after bytes_val, one table lookup per byte
+    table = self.table
+    if self.width == 8:
+      for b in bytes_val:
+        crc = table[crc ^ b]
+    elif self.reflected:
+      for b in bytes_val:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    else:
+      shift = self.width - 8
+      mask = (1 << self.width) - 1
+      for b in bytes_val:
+        crc = ((crc << 8) & mask) ^ table[(crc >> shift) ^ b]
+    return crc
+
+  def _crc_blocks(self, crc, bytes_val):
+    # the register after bytes_val, BLOCK bytes at a time with numpy. the
+    # CRC is linear: the CRC of a block from a zero register is the xor of
+    # the CRCs of its bytes at their place in the block, looked up for all
+    # blocks at once. the register before the block is then carried over
+    # the block by one lookup per register byte.
+    numpy = numpy_module()
+    if self.block_tables is None:
+      self.block_tables = self._make_block_tables()
+    place, carry = self.block_tables
+    n = len(bytes_val) // self.BLOCK
+    data = numpy.frombuffer(bytes_val, numpy.uint8, n * self.BLOCK).reshape(n, self.BLOCK)
+    cols = numpy.arange(self.BLOCK)
+    for i in range(0, n, 4096):       # bounds the index arrays to 8 MB
+      blocks = numpy.bitwise_xor.reduce(place[cols, data[i:i + 4096]], axis=1)
+      for b in blocks.tolist():
+        c = b
+        for j, table in enumerate(carry):
+          c ^= table[(crc >> (8 * j)) & 0xFF]
+        crc = c
+    return self._crc_bytes(crc, memoryview(bytes_val)[n * self.BLOCK:])
+
+  def _make_block_tables(self):
+    # place[i][b]: register after byte b at offset i of a block and zeros
+    # after it, from a zero register. carry[j][v]: register after a block
+    # of zeros from register byte j set to v.
+    numpy = numpy_module()
+    table = numpy.array(self.table, numpy.uint64)
+    mask = (1 << self.width) - 1
+
+    def zero(c):
+      # the register after a zero byte, for an array of registers
+      if self.reflected:
+        return (c >> 8) ^ table[c & 0xFF]
+      return ((c << 8) & mask) ^ table[c >> (self.width - 8)]
+
+    values = numpy.arange(256, dtype=numpy.uint64)
+    row = numpy.array([self._crc_bytes(0, (b,)) for b in range(256)], numpy.uint64)
+    place = [row]
+    for _ in range(self.BLOCK - 1):
+      place.append(zero(place[-1]))
+    place = numpy.array(place[::-1])
+
+    carry = []
+    for j in range(self.width // 8):
+      c = values << numpy.uint64(8 * j)
+      for _ in range(self.BLOCK):
+        c = zero(c)
+      carry.append(c.tolist())
+    return place, carry
+
+
+class BinasciiCrc(Crc):
+  # Crc computed by binascii, the table is kept for reference
+  def __init__(self, name, width, poly, init, reflected, xorout, byteorder, func):
+    Crc.__init__(self, name, width, poly, init, reflected, xorout, byteorder)
+    self.func = func
+
+
+# checksums selectable by name
+CHECKSUMS = {}
+
+for c in (Checksum('mod', 1, sum_mod),
+          Checksum('xor', 1, sum_xor),
+          Crc('crc8', 8, 0x07),
+          Crc('crc8-maxim', 8, 0x31, reflected=True),
+          BinasciiCrc('crc16-ccitt', 16, 0x1021, 0xFFFF, False, 0, 'big',
+                      lambda b: binascii.crc_hqx(b, 0xFFFF)),
+          BinasciiCrc('crc16-xmodem', 16, 0x1021, 0, False, 0, 'big',
+                      lambda b: binascii.crc_hqx(b, 0)),
+          Crc('crc16-modbus', 16, 0x8005, 0xFFFF, reflected=True, byteorder='little'),
+          BinasciiCrc('crc32', 32, 0x04C11DB7, 0xFFFFFFFF, True, 0xFFFFFFFF, 'little',
+                      binascii.crc32)):
+  CHECKSUMS[c.name] = c
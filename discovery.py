@@ -0,0 +1,108 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# discovery.py     background serial port discovery of Bt3
+#
+# Enumerating the ports can take a noticeable time, on Windows in
+# particular, so it runs on a thread of its own instead of at startup.
+# The ports are polled, which works the same on every platform and also
+# sees a USB adapter that re-enumerates under a new name.
+#
+
+import os
+import time
+import threading
+
+
+def port_id(info):
+  # identity of a port that survives re-enumeration: USB adapters by
+  # vid:pid and serial number, or the hub port when there is none. other
+  # ports by their device name.
+  if info.vid is not None:
+    return (info.vid, info.pid, info.serial_number or info.location)
+  return info.device
+
+
+class PortWatcher(object):
+  """PortWatcher - Tracks the serial ports present.
+
+     comports() runs every interval seconds on a thread of its own.
+     ports is replaced by a new list only when a port appeared or went
+     away, so a reader can tell a change by the identity of the list.
+  """
+  def __init__(self, interval=1.0):
+    self.interval = interval
+    self.ports = []            # ListPortInfo of the ports present, by device name
+    self.scans = 0
+    self.scan_time = 0.0       # seconds the last scan took
+    self._stop = threading.Event()
+    self.thd = None
+
+  @property
+  def devices(self):
+    return [p.device for p in self.ports]
+
+  def find(self, pid):
+    """Return the device name of the port with port_id pid, or None."""
+    for p in self.ports:
+      if port_id(p) == pid:
+        return p.device
+    if isinstance(pid, str) and os.path.exists(pid):
+      # not enumerated, e.g. a pty, but there
+      return pid
+    return None
+
+  def id_of(self, device):
+    """Return the port_id of device."""
+    for p in self.ports:
+      if p.device == device:
+        return port_id(p)
+    return device
+
+  def scan(self):
+    """Enumerate the ports once, returns True when they changed."""
+    from serial.tools import list_ports   # slow import, done on the scanning thread
+    t0 = time.perf_counter()
+    ports = sorted(list_ports.comports(), key=lambda p: p.device)
+    self.scan_time = time.perf_counter() - t0
+    self.scans += 1
+    if [(p.device, port_id(p)) for p in ports] == [(p.device, port_id(p)) for p in self.ports]:
+      return False
+    self.ports = ports
+    return True
+
+  def start(self):
+    self._stop.clear()
+    self.thd = threading.Thread(target=self.run)
+    self.thd.daemon = True
+    self.thd.start()
+
+  def stop(self):
+    self._stop.set()
+    if self.thd:
+      self.thd.join()
+      self.thd = None
+
+  def run(self):
+    while True:
+      self.scan()
+      if self._stop.wait(self.interval):
+        break
@@ -0,0 +1,108 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# events.py     event delivery from worker threads to the Tk thread
+#
+# Tk may only be touched from the thread running its mainloop, but the
+# model reports from wherever things happen: echo from the TX thread,
+# status from the receiving, bridge and generator threads. An EventBus
+# queues these events and the Tk thread delivers them on its update tick,
+# a burst of events of a batch topic arrives as one list.
+#
+
+import threading
+import collections
+
+
+class _Topic(object):
+  # queue and subscribers of one kind of event
+  def __init__(self, name, priority, maxlen, batch):
+    self.name = name
+    self.priority = priority
+    self.batch = batch
+    self.queue = collections.deque(maxlen=maxlen)
+    self.subscribers = []
+    self.posted = 0
+    self.dropped = 0
+
+
+class EventBus(object):
+  """EventBus - Carries events from any thread to the one calling dispatch().
+
+     post() queues an event of a topic from any thread, dispatch()
+     delivers the queued events to the subscribers of their topic. Topics
+     are delivered by priority, the lowest number first, events of a
+     topic in the order they were posted. A batch topic passes all its
+     queued events in one call as a list. A topic holds at most maxlen
+     events, when full the oldest is dropped and counted.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.topics = {}
+    self.order = []           # topics by priority
+
+  def topic(self, name, priority=10, maxlen=1024, batch=False):
+    """Declare topic name."""
+    t = self.topics[name] = _Topic(name, priority, maxlen, batch)
+    self.order = sorted(self.topics.values(), key=lambda t: t.priority)
+    return t
+
+  def subscribe(self, name, func):
+    """Call func with the events of topic name, or their list for a batch topic."""
+    self.topics[name].subscribers.append(func)
+
+  def forward(self, observable, name):
+    """Post the values set on a support.Observable to topic name."""
+    observable.addCallback(lambda value: self.post(name, value))
+
+  def post(self, name, value):
+    t = self.topics[name]
+    with self.lock:
+      if len(t.queue) == t.queue.maxlen:
+        t.dropped += 1
+      t.queue.append(value)
+      t.posted += 1
+
+  def pending(self):
+    return sum([len(t.queue) for t in self.order])
+
+  @property
+  def dropped(self):
+    return sum([t.dropped for t in self.order])
+
+  def dispatch(self):
+    """Deliver the queued events, returns the number delivered. Call
+       this from the thread the subscribers expect to run on."""
+    with self.lock:
+      batches = [(t, list(t.queue)) for t in self.order if t.queue]
+      for t, _ in batches:
+        t.queue.clear()
+
+    cnt = 0
+    for t, events in batches:
+      cnt += len(events)
+      for func in t.subscribers:
+        if t.batch:
+          func(events)
+        else:
+          for value in events:
+            func(value)
+    return cnt
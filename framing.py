@@ -0,0 +1,215 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# framing.py     incremental frame decoders for the Bt3 views
+#
+# A framer is fed the received chunks and returns the frames completed so
+# far. Chunks are appended to one growable buffer and scanning resumes
+# where the previous feed() stopped, so a long frame arriving in small
+# pieces is neither copied nor scanned more than once.
+#
+
+class Framer(object):
+  """Framer - Pass-through framer, every chunk is a frame.
+
+     Base of the framers: subclasses override _frames() to find complete
+     frames at the front of buf. offset is the stream offset of buf[0],
+     ends holds the stream offsets just past the frames returned by the
+     last feed(). errors counts malformed frames.
+  """
+  def __init__(self, max_size=65536):
+    self.max_size = max_size
+    self.buf = bytearray()
+    self.offset = 0
+    self.ends = []
+    self.frames = 0
+    self.errors = 0
+
+  def reset(self):
+    """Drop the partial frame."""
+    del self.buf[:]
+
+  def feed(self, bytes_val):
+    """Return the list of frames completed by bytes_val."""
+    self.buf += bytes_val
+    frames, ends, used = self._frames()
+    self.ends = [self.offset + e for e in ends]
+    del self.buf[:used]
+    self.offset += used
+    self.frames += len(frames)
+    return frames
+
+  def _frames(self):
+    # return (frames, ends, used): the frames, the buf index past each of
+    # them and the number of bytes of buf used up
+    return [bytes(self.buf)], [len(self.buf)], len(self.buf)
+
+
+class DelimiterFramer(Framer):
+  """DelimiterFramer - Frames end with a fixed byte sequence.
+
+     With strip the delimiter is removed from the frames. Data exceeding
+     max_size without a delimiter is passed on as an erroneous frame.
+  """
+  def __init__(self, delimiter=b'\n', strip=False, max_size=65536):
+    Framer.__init__(self, max_size)
+    self.delimiter = delimiter
+    self.strip = strip
+    self._scan = 0
+
+  def reset(self):
+    Framer.reset(self)
+    self._scan = 0
+
+  def _frames(self):
+    buf = self.buf
+    dlen = len(self.delimiter)
+    frames = []
+    ends = []
+    start = 0
+    with memoryview(buf) as view:
+      pos = buf.find(self.delimiter, self._scan)
+      while pos >= 0:
+        end = pos + dlen
+        frame = self._decode(view[start:pos if self.strip else end])
+        if frame is not None:
+          frames.append(frame)
+          ends.append(end)
+        start = end
+        pos = buf.find(self.delimiter, start)
+
+      if len(buf) - start > self.max_size:
+        self.errors += 1
+        frames.append(bytes(view[start:]))
+        start = len(buf)
+        ends.append(start)
+
+    # a delimiter may be split over chunks, rescan its first bytes
+    self._scan = max(0, len(buf) - start - dlen + 1)
+    return frames, ends, start
+
+  def _decode(self, view):
+    # return the frame of the raw bytes in view, None to skip it
+    return bytes(view)
+
+
+class SlipFramer(DelimiterFramer):
+  # RFC 1055 SLIP, frames are returned unescaped
+  END = b'\xC0'
+
+  def __init__(self, max_size=65536):
+    DelimiterFramer.__init__(self, self.END, True, max_size)
+
+  def _decode(self, view):
+    if not view:
+      return None   # END at the start of a frame
+    return bytes(view).replace(b'\xDB\xDC', b'\xC0').replace(b'\xDB\xDD', b'\xDB')
+
+
+class CobsFramer(DelimiterFramer):
+  # consistent overhead byte stuffing, zero delimited, frames are returned decoded
+  def __init__(self, max_size=65536):
+    DelimiterFramer.__init__(self, b'\x00', True, max_size)
+
+  def _decode(self, view):
+    if not view:
+      return None
+    try:
+      return cobs_decode(view)
+    except ValueError:
+      self.errors += 1
+      return None
+
+
+class LengthFramer(Framer):
+  """LengthFramer - Frames carry their payload length.
+
+     A frame is header bytes, a size byte length field in byteorder, the
+     payload of length + adjust bytes and trailer bytes (a checksum for
+     instance). Impossible lengths drop one byte to find the next frame.
+  """
+  def __init__(self, size=1, byteorder='big', header=0, trailer=0, adjust=0, max_size=65536):
+    Framer.__init__(self, max_size)
+    self.size = size
+    self.byteorder = byteorder
+    self.header = header
+    self.trailer = trailer
+    self.adjust = adjust
+
+  def _frames(self):
+    buf = self.buf
+    hlen = self.header + self.size
+    frames = []
+    ends = []
+    start = 0
+    with memoryview(buf) as view:
+      while len(buf) - start >= hlen:
+        cnt = int.from_bytes(view[start + self.header:start + hlen], self.byteorder) + self.adjust
+        total = hlen + cnt + self.trailer
+        if cnt < 0 or total > self.max_size:
+          self.errors += 1
+          start += 1
+          continue
+        if len(buf) - start < total:
+          break
+        frames.append(bytes(view[start:start + total]))
+        start += total
+        ends.append(start)
+
+    return frames, ends, start
+
+
+def cobs_decode(bytes_val):
+  # return the COBS decoded bytes_val, without the zero delimiter
+  out = bytearray()
+  i = 0
+  n = len(bytes_val)
+  while i < n:
+    code = bytes_val[i]
+    if code == 0 or i + code > n:
+      raise ValueError('invalid COBS frame')
+    out += bytes_val[i + 1:i + code]
+    i += code
+    if code < 0xFF and i < n:
+      out.append(0)
+  return bytes(out)
+
+
+def cobs_encode(bytes_val):
+  # return the COBS encoded bytes_val, without the zero delimiter
+  out = bytearray()
+  for block in bytes(bytes_val).split(b'\x00'):
+    while len(block) >= 0xFE:
+      out.append(0xFF)
+      out += block[:0xFE]
+      block = block[0xFE:]
+    out.append(len(block) + 1)
+    out += block
+  return bytes(out)
+
+
+# framers selectable in the view, by name
+FRAMERS = {'raw':   Framer,
+           'line':  lambda: DelimiterFramer(b'\n', strip=True),
+           'slip':  SlipFramer,
+           'cobs':  CobsFramer,
+           'len8':  lambda: LengthFramer(1),
+           'len16': lambda: LengthFramer(2)}
@@ -0,0 +1,122 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# generator.py     timed traffic generator of Bt3
+#
+# Sends pre-encoded frames, rotating through a list, at a fixed rate on an
+# absolute deadline schedule: the n-th burst is due at start + n / rate, so
+# neither sleep overshoot nor send time accumulates into drift. The waits
+# are on an event stop() sets, so stopping never waits out a long period.
+#
+
+import time
+import threading
+
+
+class TrafficGenerator(object):
+  """TrafficGenerator - Sends frames at rate bursts per second.
+
+     send is called with the wire bytes of each frame, e.g. Terminal.send.
+     A burst sends burst frames back to back, rate 0 sends as fast as send
+     returns. count limits the number of frames, None runs until stop().
+     A frame send refuses by returning False is skipped and counted as
+     refused, not sent.
+  """
+  SPIN = 0.0005    # seconds before a deadline to stop sleeping and spin, yielding the GIL
+  BACKOFF = 0.01   # seconds to wait after a refused frame
+
+  def __init__(self, send, frames, rate=1.0, burst=1, count=None):
+    self.send = send
+    self.frames = [bytes(f) for f in frames]
+    self.rate = rate
+    self.burst = burst
+    self.count = count
+    self.active = False
+    self.stopped = threading.Event()
+    self.thd = None
+    self.sent = 0
+    self.bytes = 0
+    self.refused = 0      # frames send returned False for
+    self.late = 0         # bursts started more than a period behind schedule
+    self.bursts = 0
+    self.last = 0.0       # start of the last burst, seconds from the start
+    self.elapsed = 0.0
+
+  def run(self):
+    """Generate on the calling thread."""
+    self.active = True
+    self.stopped.clear()
+    frames = self.frames
+    n_frames = len(frames)
+    period = 1.0 / self.rate if self.rate else 0.0
+    start = time.perf_counter()
+    bursts = 0
+    while self.active and (self.count is None or self.sent < self.count):
+      if period:
+        deadline = start + bursts * period
+        now = time.perf_counter()
+        if deadline - now > self.SPIN and self.stopped.wait(deadline - now - self.SPIN):
+          break
+        while time.perf_counter() < deadline:
+          time.sleep(0)    # let the listener and Tk have the GIL while spinning
+        if time.perf_counter() - deadline > period:
+          self.late += 1
+
+      self.last = time.perf_counter() - start
+      for _ in range(self.burst):
+        frame = frames[(self.sent + self.refused) % n_frames]
+        if self.send(frame) is False:
+          self.refused += 1
+          if self.stopped.wait(self.BACKOFF):
+            break
+          continue
+        self.sent += 1
+        self.bytes += len(frame)
+        if self.count is not None and self.sent >= self.count:
+          break
+      bursts += 1
+      self.bursts = bursts
+
+    self.elapsed = time.perf_counter() - start
+    self.active = False
+
+  def start(self):
+    """Generate on a thread of its own."""
+    self.thd = threading.Thread(target=self.run)
+    self.thd.daemon = True
+    self.thd.start()
+
+  def stop(self):
+    self.active = False
+    self.stopped.set()
+    if self.thd:
+      self.thd.join()
+
+  def achieved(self):
+    """Return the achieved rate in bursts per second."""
+    if self.bursts < 2 or not self.last:
+      return 0.0
+    return (self.bursts - 1) / self.last
+
+  def report(self):
+    target = '%g Hz' % self.rate if self.rate else 'line rate'
+    return 'sent %d frames (%d bytes) in %.3f s, %.2f Hz (target %s), %d late, %d refused' % (
+           self.sent, self.bytes, self.elapsed, self.achieved(), target, self.late, self.refused)
@@ -0,0 +1,264 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# linkstats.py     statistics of how the bytes arrive on a link
+#
+# Timing problems show in how the data arrives, not in what it is: bursts,
+# gaps, frame lengths. LinkStats is fed every received chunk on the
+# receiving thread and keeps its counters in arrays that are updated in
+# place, per chunk rather than per byte. The byte value histogram uses
+# numpy when it is installed, otherwise the chunks are collected and
+# counted in bulk.
+#
+# Gaps are binned by powers of two of microseconds and frame sizes by
+# powers of two of bytes: bin k holds values from 2**(k-1) up to 2**k.
+#
+
+import json
+import math
+import time
+import threading
+import collections
+from array import array
+
+from support import numpy_module
+
+GAP_BINS = 32      # up to 2**31 us, about 36 minutes
+SIZE_BINS = 24     # up to 8 MB
+HIST_BATCH = 16384 # bytes collected before they are counted without numpy
+
+
+def _bin(value, bins):
+  return min(max(0, int(value)).bit_length(), bins - 1)
+
+
+def _lower(k):
+  # smallest value of bin k
+  return 1 << (k - 1) if k else 0
+
+
+def _time(us):
+  if us >= 1000000:
+    return '%gs' % (us / 1e6)
+  if us >= 1000:
+    return '%gms' % (us / 1e3)
+  return '%dus' % us
+
+
+def _size(n):
+  if n >= 1 << 20:
+    return '%dM' % (n >> 20)
+  if n >= 1 << 10:
+    return '%dk' % (n >> 10)
+  return '%d' % n
+
+
+def _zeros(n):
+  return array('q', bytes(8 * n))
+
+
+class LinkStats(object):
+  """LinkStats - Incremental statistics of a received byte stream.
+
+     feed() takes each received chunk with its arrival time. Kept are the
+     bytes per second of the last window seconds, the current one
+     included, histograms of the gaps
+     between chunks and between frames, the frame sizes and the byte
+     values. Frames are cut by framer when set, a framing.Framer, and are
+     bursts of chunks otherwise: a burst ends when the line is idle for
+     burst_gap seconds or four characters, whichever is longer.
+  """
+  def __init__(self, window=61, burst_gap=0.001):
+    self.lock = threading.Lock()
+    self.window = window
+    self.burst_gap = burst_gap
+    self.framer = None
+    self.char_ns = 0
+    self.reset()
+
+  def reset(self):
+    """Start over, keeps the framer and the character time."""
+    with self.lock:
+      self.bytes = 0
+      self.chunks = 0
+      self.frames = 0
+      self.frame_bytes = 0
+      self.frame_min = None
+      self.frame_max = 0
+      self.first_ns = None      # arrival of the first and the last chunk
+      self.seen_ns = None
+      self.rate = _zeros(self.window)         # bytes received in second rate_sec[i]
+      self.rate_sec = array('q', [-1] * self.window)
+      self.peak = 0                           # most bytes in one second
+      self.byte_hist = _zeros(256)
+      self.chunk_gaps = _zeros(GAP_BINS)
+      self.frame_gaps = _zeros(GAP_BINS)
+      self.frame_sizes = _zeros(SIZE_BINS)
+      numpy = self._numpy = numpy_module()    # imported once stats are kept
+      self._byte_hist = numpy.frombuffer(self.byte_hist, numpy.int64) if numpy else None
+      self._uncounted = bytearray()           # bytes not in byte_hist yet, without numpy
+    self.restart(self.char_ns)
+
+  def restart(self, char_ns=0):
+    """A new connection, at char_ns per character. The time since the
+       last chunk is not a gap and a partial frame is dropped."""
+    with self.lock:
+      self.char_ns = char_ns
+      self.burst_ns = max(int(self.burst_gap * 1e9), 4 * char_ns)
+      self.last_ns = None       # arrival of the last chunk of this connection
+      self.frame_end = None     # end time of the last frame
+      self.burst_size = 0
+      if self.framer:
+        self.framer.reset()
+
+  def set_framer(self, framer):
+    with self.lock:
+      self.framer = framer
+      self.burst_size = 0
+
+  def feed(self, data, t_ns):
+    """Add a chunk received at t_ns, the arrival of its last byte."""
+    n = len(data)
+    with self.lock:
+      self.bytes += n
+      self.chunks += 1
+      sec = t_ns // 1000000000
+      slot = sec % self.window
+      if self.rate_sec[slot] != sec:
+        self.rate_sec[slot] = sec
+        self.rate[slot] = 0
+      self.rate[slot] += n
+      if self.rate[slot] > self.peak:
+        self.peak = self.rate[slot]
+
+      if self._byte_hist is not None:
+        numpy = self._numpy
+        self._byte_hist += numpy.bincount(numpy.frombuffer(data, numpy.uint8), minlength=256)
+      else:
+        self._uncounted += data
+        if len(self._uncounted) >= HIST_BATCH:
+          self._count()
+
+      if self.last_ns is None:
+        if self.first_ns is None:
+          self.first_ns = t_ns
+      else:
+        self.chunk_gaps[_bin((t_ns - self.last_ns) // 1000, GAP_BINS)] += 1
+      self.seen_ns = t_ns
+
+      if self.framer:
+        frames = self.framer.feed(data)
+        if frames:
+          end = self.framer.offset + len(self.framer.buf)
+          for f, e in zip(frames, self.framer.ends):
+            self._frame(len(f), t_ns - (end - e) * self.char_ns)
+      else:
+        if self.burst_size and t_ns - n * self.char_ns - self.last_ns > self.burst_ns:
+          self._frame(self.burst_size, self.last_ns)
+          self.burst_size = 0
+        self.burst_size += n
+      self.last_ns = t_ns
+
+  def _count(self):
+    # add the collected bytes to byte_hist, the lock is held
+    if self._uncounted:
+      hist = self.byte_hist
+      for value, cnt in collections.Counter(self._uncounted).items():
+        hist[value] += cnt
+      del self._uncounted[:]
+
+  def _frame(self, size, t_end):
+    # add a frame of size bytes that ended at t_end
+    if self.frame_end is not None:
+      self.frame_gaps[_bin((t_end - size * self.char_ns - self.frame_end) // 1000, GAP_BINS)] += 1
+    self.frame_end = t_end
+    self.frames += 1
+    self.frame_bytes += size
+    self.frame_sizes[_bin(size, SIZE_BINS)] += 1
+    self.frame_min = size if self.frame_min is None else min(self.frame_min, size)
+    self.frame_max = max(self.frame_max, size)
+
+  def throughput(self, seconds=1):
+    """Bytes per second over the last complete seconds, at most window."""
+    seconds = min(seconds, self.window - 1)
+    now = time.monotonic_ns() // 1000000000
+    with self.lock:
+      total = sum([self.rate[i] for i in range(self.window) if now - seconds <= self.rate_sec[i] < now])
+    return total / seconds
+
+  def snapshot(self):
+    """Return the statistics as a dict, the histograms as [lower bound, count]
+       of the bins in use, gaps in us."""
+    rates = {'rate_%ds' % s: self.throughput(s) for s in (1, 10, 60)}
+    with self.lock:
+      self._count()
+      hist = lambda bins: [[_lower(k), c] for k, c in enumerate(bins) if c]
+      snap = {'bytes': self.bytes,
+              'chunks': self.chunks,
+              'frames': self.frames,
+              'seconds': (self.seen_ns - self.first_ns) / 1e9 if self.first_ns is not None else 0.0,
+              'peak_rate': self.peak,
+              'frame_min': self.frame_min or 0,
+              'frame_max': self.frame_max,
+              'frame_mean': self.frame_bytes / self.frames if self.frames else 0.0,
+              'chunk_gaps_us': hist(self.chunk_gaps),
+              'frame_gaps_us': hist(self.frame_gaps),
+              'frame_sizes': hist(self.frame_sizes),
+              'byte_values': list(self.byte_hist)}
+    snap.update(rates)
+    total = sum(snap['byte_values'])
+    snap['entropy'] = -sum([c / total * math.log2(c / total) for c in snap['byte_values'] if c]) if total else 0.0
+    return snap
+
+  def to_json(self, snap=None):
+    return json.dumps({'time': time.time(), 'link': snap or self.snapshot()}, sort_keys=True)
+
+  def save(self, path):
+    with open(path, 'w') as f:
+      f.write(self.to_json())
+
+  def report(self, width=20):
+    """Return the statistics as text, histograms as bars of at most width."""
+    s = self.snapshot()
+    lines = ['bytes  %12d  chunks %9d' % (s['bytes'], s['chunks']),
+             'B/s    1s %7.0f  10s %7.0f' % (s['rate_1s'], s['rate_10s']),
+             '       60s %6.0f  peak %6d' % (s['rate_60s'], s['peak_rate']),
+             'frames %12d  size %d..%d, avg %.1f' % (s['frames'], s['frame_min'], s['frame_max'], s['frame_mean'])]
+
+    def bars(title, hist, label):
+      lines.append('')
+      lines.append(title)
+      top = max([c for _, c in hist] or [1])
+      for lower, c in hist:
+        lines.append('  >=%8s %9d %s' % (label(lower), c, '#' * max(1, c * width // top)))
+
+    bars('chunk gaps', s['chunk_gaps_us'], _time)
+    bars('frame gaps', s['frame_gaps_us'], _time)
+    bars('frame sizes', s['frame_sizes'], _size)
+
+    values = s['byte_values']
+    total = sum(values) or 1
+    top = sorted(range(256), key=lambda b: -values[b])[:8]
+    lines.append('')
+    lines.append('byte values, entropy %.2f bits' % s['entropy'])
+    for i in range(0, len(top), 2):
+      lines.append('  ' + '   '.join(['0x%02x %5.1f%%' % (b, 100.0 * values[b] / total) for b in top[i:i + 2] if values[b]]))
+    return '\n'.join(lines)
@@ -0,0 +1,141 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# metrics.py     runtime metrics of Bt3
+#
+# Metrics are read from the counters the components keep anyway (bytes
+# received, frames written, ...) when a snapshot is taken, nothing is
+# added to the data path. Counters also get a per second rate computed
+# between two snapshots.
+#
+
+import os
+import json
+import time
+import threading
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+
+
+class Metrics(object):
+  """Metrics - A set of named counters and gauges.
+
+     Each metric is a function returning its current value, registered
+     with add(). snapshot() reads them all, a status bar and an exporter
+     each keep their own previous snapshot to compute rates against.
+  """
+  def __init__(self, prefix='bt3'):
+    self.prefix = prefix
+    self.sources = {}
+    self.started = time.monotonic()
+    self.add('uptime_seconds', lambda: time.monotonic() - self.started, GAUGE, 'seconds since start')
+
+  def add(self, name, func, kind=COUNTER, help=''):
+    """Register metric name, read by calling func()."""
+    self.sources[name] = (func, kind, help)
+
+  def snapshot(self, last=None):
+    """Return {name: value}, with a name_rate per counter against last."""
+    snap = {name: func() for name, (func, _, _) in self.sources.items()}
+    dt = snap['uptime_seconds'] - last['uptime_seconds'] if last else 0.0
+    for name, (_, kind, _) in self.sources.items():
+      if kind == COUNTER:
+        value = snap[name]
+        prev = last.get(name, value) if last else value
+        if value < prev:
+          prev = 0             # counter restarted, e.g. on reconnect
+        snap[name + '_rate'] = (value - prev) / dt if dt > 0 else 0.0
+    return snap
+
+  def to_json(self, snap):
+    return json.dumps({'time': time.time(), 'metrics': snap}, sort_keys=True)
+
+  def to_prometheus(self, snap):
+    # Prometheus text exposition format
+    lines = []
+    for name in sorted(snap):
+      base = name[:-5] if name.endswith('_rate') else name
+      kind = GAUGE if base != name else self.sources.get(name, (None, GAUGE))[1]
+      help = self.sources.get(base, (None, None, ''))[2]
+      if help and base != name:
+        help += ' per second'
+      metric = '%s_%s' % (self.prefix, name)
+      if help:
+        lines.append('# HELP %s %s' % (metric, help))
+      lines.append('# TYPE %s %s' % (metric, kind))
+      lines.append('%s %s' % (metric, float(snap[name])))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter(object):
+  """MetricsExporter - Writes snapshots to a file every interval seconds.
+
+     fmt is 'json' or 'prom'. The file is replaced atomically, so a
+     dashboard never reads half a snapshot.
+  """
+  def __init__(self, metrics, path, fmt='json', interval=5.0):
+    self.metrics = metrics
+    self.path = path
+    self.fmt = fmt
+    self.interval = interval
+    self.last = None
+    self._stop = threading.Event()
+    self.thd = None
+
+  def start(self):
+    self.thd = threading.Thread(target=self.run)
+    self.thd.daemon = True
+    self.thd.start()
+
+  def stop(self):
+    self._stop.set()
+    if self.thd:
+      self.thd.join()
+    self.write()
+
+  def run(self):
+    while not self._stop.wait(self.interval):
+      self.write()
+
+  def write(self):
+    snap = self.last = self.metrics.snapshot(self.last)
+    text = self.metrics.to_json(snap) if self.fmt == 'json' else self.metrics.to_prometheus(snap)
+    tmp = self.path + '.tmp'
+    with open(tmp, 'w') as f:
+      f.write(text)
+    os.replace(tmp, self.path)
+
+
+def terminal_metrics(metrics, term, name=''):
+  # register the metrics of a Terminal, name prefixes them for sessions
+  p = name + '_' if name else ''
+  metrics.add(p + 'rx_bytes', lambda: term.rx_bytes, COUNTER, 'bytes received')
+  metrics.add(p + 'rx_chunks', lambda: term.rx_chunks, COUNTER, 'reads returning data')
+  metrics.add(p + 'rx_queue', lambda: term.rxQ.qsize(), GAUGE, 'chunks waiting in rxQ')
+  metrics.add(p + 'rx_overflows', lambda: getattr(term.rxQ, 'overflows', 0), COUNTER, 'times the RX ring was full')
+  metrics.add(p + 'rx_dropped_bytes', lambda: getattr(term.rxQ, 'dropped', 0), COUNTER,
+              'bytes dropped or spilled by the RX ring')
+  metrics.add(p + 'tx_bytes', lambda: term.tx.bytes if term.tx else 0, COUNTER, 'bytes written')
+  metrics.add(p + 'tx_frames', lambda: term.tx.frames if term.tx else 0, COUNTER, 'frames written')
+  metrics.add(p + 'tx_queue', lambda: term.tx.depth if term.tx else 0, GAUGE, 'frames waiting to be written')
+  metrics.add(p + 'tx_dropped', lambda: term.tx.dropped if term.tx else 0, COUNTER, 'frames refused by a full TX queue')
+  metrics.add(p + 'tx_blocked_seconds', lambda: term.tx.blocked if term.tx else 0.0, COUNTER, 'time spent in port writes')
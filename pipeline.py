@@ -0,0 +1,158 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# pipeline.py     formatting of received data in worker processes
+#
+# At multi-megabaud rates framing, checking and formatting the frames takes
+# more than the Tk thread has. FormatPool copies blocks of received bytes
+# into shared memory and has a pool of processes frame, check and format
+# them, the results come back in submission order, ready to be inserted.
+#
+
+import os
+import bisect
+import collections
+import multiprocessing
+from multiprocessing import shared_memory
+
+from support import Timecode, hex_dump
+from framing import FRAMERS
+from checksum import CHECKSUMS
+
+
+def format_frames(frames, times, hex_view, timecode=None, check=None):
+  # return the (text, tag) of each frame as the terminal shows it, a
+  # hexdump or an ascii line, stamped with its time when timecode is set.
+  # frames failing check are tagged foreground_bad.
+  if hex_view:
+    if timecode:
+      texts = ['%s\n%s' % (timecode.format(t), hex_dump(f)) for f, t in zip(frames, times)]
+    else:
+      texts = [hex_dump(f) for f in frames]
+  elif timecode:
+    texts = ['%s %s\n' % (timecode.format(t), f.decode('ascii', errors='ignore')) for f, t in zip(frames, times)]
+  else:
+    texts = ['%s\n' % f.decode('ascii', errors='ignore') for f in frames]
+
+  if not check:
+    return [(text, 'foreground_blk') for text in texts]
+  return [(text, 'foreground_blk' if check.verify(f) else 'foreground_bad') for f, text in zip(frames, texts)]
+
+
+# the shared memory as seen by a worker process
+_shm = None
+
+
+def _attach(name):
+  global _shm
+  _shm = shared_memory.SharedMemory(name)
+
+
+def _format_block(job):
+  # format one block of whole frames of spec['framer'] in a worker.
+  # returns (runs, frame ends, lines per frame, bad frames, frames the
+  # framer dropped).
+  start, length, marks, spec = job
+  data = bytes(_shm.buf[start:start + length]) if length is not None else start
+  framer = FRAMERS[spec['framer']]()
+  frames = framer.feed(data)
+  ends = framer.ends
+
+  timecode = None
+  times = ()
+  if spec['time']:
+    # the time of a frame is interpolated back from the chunk completing it
+    timecode = Timecode(spec['time'][0])
+    timecode.offset = spec['time'][1]
+    mark_ends = [e for e, _ in marks]
+    times = []
+    for e in ends:
+      m_end, t_ns = marks[min(bisect.bisect_left(mark_ends, e), len(marks) - 1)]
+      times.append(t_ns - (m_end - e) * spec['char_ns'])
+
+  formatted = format_frames(frames, times, spec['hex'], timecode, CHECKSUMS.get(spec['check']))
+  lines = [text.count('\n') for text, _ in formatted]
+  bad = sum([1 for _, tag in formatted if tag == 'foreground_bad'])
+
+  # neighbours with the same tag travel back as one run
+  runs = []
+  for text, tag in formatted:
+    if runs and runs[-1][1] == tag:
+      runs[-1][0].append(text)
+    else:
+      runs.append(([text], tag))
+  return [(''.join(texts), tag) for texts, tag in runs], ends, lines, bad, framer.errors
+
+
+class FormatPool(object):
+  """FormatPool - Formats blocks of received data in worker processes.
+
+     Blocks are copied into one of slots shared memory slots of slot_size
+     bytes and formatted by worker processes, a larger block is pickled
+     over the pool's pipe instead. results() returns them in the order
+     they were submitted. With no free slot left room() is False and the
+     caller leaves the data where it is.
+  """
+  def __init__(self, workers=None, slots=16, slot_size=256 * 1024):
+    self.slot_size = slot_size
+    self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+    # the window process runs Tk and threads by now, which a forked worker
+    # would inherit in whatever state they are in: start workers fresh
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    self.pool = ctx.Pool(workers or max(1, (os.cpu_count() or 2) - 1), _attach, (self.shm.name,))
+    self.free = list(range(slots))
+    self.jobs = collections.deque()     # (slot, meta, AsyncResult) in submission order
+
+  def room(self):
+    return bool(self.free)
+
+  def pending(self):
+    return len(self.jobs)
+
+  def submit(self, data, marks, spec, meta=None):
+    """Format data as spec says. marks are the (end, t_ns) of the chunks
+       in data, meta is returned with the result."""
+    if len(data) > self.slot_size:
+      slot = None
+      job = (bytes(data), None, marks, spec)
+    else:
+      slot = self.free.pop()
+      start = slot * self.slot_size
+      self.shm.buf[start:start + len(data)] = data
+      job = (start, len(data), marks, spec)
+    self.jobs.append((slot, meta, self.pool.apply_async(_format_block, (job,))))
+
+  def results(self, wait=False):
+    """Yield (meta, result) of the jobs done, in order. With wait all
+       submitted jobs are waited for."""
+    while self.jobs and (wait or self.jobs[0][2].ready()):
+      slot, meta, res = self.jobs.popleft()
+      result = res.get()
+      if slot is not None:
+        self.free.append(slot)
+      yield meta, result
+
+  def close(self):
+    self.pool.terminate()
+    self.pool.join()
+    self.shm.close()
+    self.shm.unlink()
@@ -0,0 +1,190 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# replay.py     replay of recorded byte streams into Bt3
+#
+# A Replayer feeds (t_ns, bytes) chunks into a sink, either Terminal.inject
+# directly or the write() of a Loopback, a pseudo-terminal whose device
+# name serial.Serial can open in place of a real UART.
+#
+# speed 1.0 replays in real time, 10.0 ten times faster, 0 as fast as
+# the sink accepts the data.
+#
+# usage: python replay.py capture.bt3 [--speed 10] [--loop]
+#
+
+import os
+import sys
+import time
+import select
+import argparse
+import threading
+
+import capture
+
+
+class Loopback(object):
+  """Loopback - A pseudo-terminal pair standing in for a device.
+
+     Open device with serial.Serial (or set it as Terminal device), data
+     written here arrives there as RX and TX sent there can be read here.
+  """
+  def __init__(self):
+    self.master, self.slave = os.openpty()
+    self.device = os.ttyname(self.slave)
+
+  def write(self, bytes_val):
+    view = memoryview(bytes_val)
+    while view:
+      view = view[os.write(self.master, view):]
+
+  def read(self, cnt=4096):
+    return os.read(self.master, cnt)
+
+  def wait_open(self, timeout=None, interval=0.01, settle=0.1):
+    """Wait until device is opened, returns False after timeout seconds.
+       Lets go of the slave end held here, the master reports a hangup
+       until another file opens it. Returns settle seconds after the open,
+       serial.Serial flushes the input once it has set the port up."""
+    if self.slave is not None:
+      os.close(self.slave)
+      self.slave = None
+    poll = select.poll()
+    poll.register(self.master, select.POLLOUT)
+    end = None if timeout is None else time.monotonic() + timeout
+    while any(ev & select.POLLHUP for _, ev in poll.poll(0)):
+      if end is not None and time.monotonic() >= end:
+        return False
+      time.sleep(interval)
+    time.sleep(settle)
+    return True
+
+  def close(self):
+    os.close(self.master)
+    if self.slave is not None:
+      os.close(self.slave)
+
+
+def capture_stream(path, direction=capture.RX, port=None):
+  # yield the (t_ns, bytes) chunks of one direction of a capture
+  reader = capture.CaptureReader(path)
+  for _, t_ns, d, p, payload in reader.records():
+    if d == direction and (port is None or p == port):
+      yield t_ns, bytes(payload)
+
+
+def file_stream(path, chunk=256, baud=115200):
+  # yield the contents of a raw file in chunks, timed as if received at
+  # baud with 10 bit times per byte
+  ns_per_byte = 10 * 10**9 // baud
+  t_ns = 0
+  with open(path, 'rb') as f:
+    for data in iter(lambda: f.read(chunk), b''):
+      yield t_ns, data
+      t_ns += len(data) * ns_per_byte
+
+
+class Replayer(object):
+  """Replayer - Plays a stream of (t_ns, bytes) chunks into sink."""
+  def __init__(self, stream, sink, speed=1.0):
+    self.stream = stream
+    self.sink = sink
+    self.speed = speed
+    self.active = False
+    self.bytes = 0
+    self.chunks = 0
+    self.elapsed = 0.0
+    self.thd = None
+
+  def run(self):
+    """Replay the stream on the calling thread."""
+    self.active = True
+    start = time.monotonic_ns()
+    t0 = None
+    for t_ns, data in self.stream:
+      if not self.active:
+        break
+      if t0 is None:
+        t0 = t_ns
+      if self.speed:
+        # absolute deadlines, sleep overshoot does not add up
+        delay = (start + (t_ns - t0) / self.speed - time.monotonic_ns()) / 1e9
+        if delay > 0:
+          time.sleep(delay)
+      self.sink(data)
+      self.bytes += len(data)
+      self.chunks += 1
+
+    self.elapsed = (time.monotonic_ns() - start) / 1e9
+    self.active = False
+
+  def start(self):
+    """Replay the stream on a thread of its own."""
+    self.thd = threading.Thread(target=self.run)
+    self.thd.daemon = True
+    self.thd.start()
+
+  def stop(self):
+    self.active = False
+    self.join()
+
+  def join(self, timeout=None):
+    if self.thd:
+      self.thd.join(timeout)
+
+
+def main(argv=None):
+  p = argparse.ArgumentParser(description='Replay a capture into a pseudo-terminal.')
+  p.add_argument('source', help='Bt3 capture, or raw bytes with --raw')
+  p.add_argument('--raw', action='store_true', help='source holds raw bytes')
+  p.add_argument('--baud', type=int, default=115200, help='pace of a raw source')
+  p.add_argument('--speed', type=float, default=1.0, help='0 replays as fast as possible')
+  p.add_argument('--loop', action='store_true', help='repeat until interrupted')
+  args = p.parse_args(argv)
+
+  loop = Loopback()
+  try:
+    while True:
+      # the clock starts once the device is open, nothing is written into
+      # a pty nobody reads
+      print('waiting for %s to be opened' % loop.device, file=sys.stderr)
+      loop.wait_open()
+      print('replaying on %s' % loop.device, file=sys.stderr)
+      if args.raw:
+        stream = file_stream(args.source, baud=args.baud)
+      else:
+        stream = capture_stream(args.source)
+      rep = Replayer(stream, loop.write, args.speed)
+      rep.run()
+      print('%d bytes in %.3f s' % (rep.bytes, rep.elapsed), file=sys.stderr)
+      if not args.loop:
+        input('done, press enter to close %s ' % loop.device)
+        break
+  except (KeyboardInterrupt, EOFError):
+    pass
+  finally:
+    loop.close()
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
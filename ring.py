@@ -0,0 +1,176 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# ring.py     preallocated receive buffer of Bt3
+#
+# The listener reads straight into a fixed bytearray instead of allocating
+# a bytes object per read, consumers get memoryview slices of it. Space is
+# handed back with release() once the consumer is done with the chunks it
+# got, so a view must not be used after the next release().
+#
+
+import time
+import queue
+import threading
+
+OVERFLOW = ('block', 'drop', 'spill')
+
+
+class RxRing(object):
+  """RxRing - A byte ring of received chunks, used like a Queue.
+
+     The producer asks writable() for free space, reads into it and
+     commit()s what it read with its time. get() returns (t_ns, view) in
+     the order they were committed, release() frees all chunks got so far.
+     put((t_ns, bytes)) copies bytes in, for producers that have them.
+
+     When the ring is full the overflow policy decides: 'block' waits for
+     the consumer, pushing back on the port, 'drop' discards the oldest
+     chunks nobody got yet, 'spill' appends them to spill_path first.
+  """
+  def __init__(self, size=1 << 20, overflow='block', spill_path=None):
+    if overflow not in OVERFLOW:
+      raise ValueError('Unknown overflow policy %s.' % overflow)
+    if overflow == 'spill' and not spill_path:
+      raise ValueError('Overflow policy spill needs a spill_path.')
+    self.size = size
+    self.overflow = overflow
+    self.spill_path = spill_path
+    self.buf = bytearray(size)
+    self.view = memoryview(self.buf)
+    self.chunks = []           # committed (start, end, t_ns) not got yet, start of the list at head
+    self.head = 0              # index into chunks of the next get()
+    self.written = 0           # stream position after the last commit
+    self.freed = 0             # stream position up to which space is free again
+    self.got = 0               # stream position after the last chunk got
+    self.overflows = 0         # times the ring was full
+    self.dropped = 0           # bytes dropped or spilled
+    self.spilled = 0           # bytes of those written to spill_path
+    self.waited = 0.0          # seconds the producer waited for space
+    self._spill = None
+    self._cond = threading.Condition()
+
+  # producer side
+
+  def writable(self, timeout=None):
+    """Return a view of the contiguous free space, empty when the ring
+       stayed full for timeout seconds."""
+    with self._cond:
+      if self.written - self.freed == self.size:
+        self.overflows += 1
+        if self.overflow != 'block' and self.got == self.freed:
+          self._discard(self.size // 8)
+        if self.written - self.freed == self.size:
+          # the consumer holds the space, wait for release()
+          t0 = time.perf_counter()
+          self._cond.wait_for(lambda: self.written - self.freed < self.size, timeout)
+          self.waited += time.perf_counter() - t0
+      start = self.written % self.size
+      free = self.size - (self.written - self.freed)
+      return self.view[start:start + min(free, self.size - start)]
+
+  def commit(self, n, t_ns):
+    """Add the n bytes just written to the writable() view as a chunk."""
+    if n:
+      with self._cond:
+        self.chunks.append((self.written, self.written + n, t_ns))
+        self.written += n
+        self._cond.notify_all()
+
+  def put(self, item, block=True, timeout=None):
+    """Copy the bytes of item (t_ns, bytes) in, as Queue.put()."""
+    t_ns, bytes_val = item
+    i = 0
+    while i < len(bytes_val):
+      view = self.writable(timeout if block else 0)
+      if not view:
+        raise queue.Full
+      n = min(len(view), len(bytes_val) - i)
+      view[:n] = bytes_val[i:i + n]
+      self.commit(n, t_ns)
+      i += n
+
+  def _discard(self, want):
+    # drop (or spill) the oldest chunks nobody got until want bytes are
+    # free, only called while no chunk is held by the consumer
+    while self.head < len(self.chunks) and self.size - (self.written - self.freed) < want:
+      start, end, _ = self.chunks[self.head]
+      self.head += 1
+      if self.overflow == 'spill':
+        if not self._spill:
+          self._spill = open(self.spill_path, 'ab')
+        s = start % self.size
+        self._spill.write(self.view[s:s + end - start])
+        self.spilled += end - start
+      self.dropped += end - start
+      self.got = self.freed = end
+    self._compact()
+
+  # consumer side
+
+  def get(self, block=True, timeout=None):
+    """Return the next (t_ns, view) chunk, raises queue.Empty."""
+    with self._cond:
+      if self.head == len(self.chunks):
+        if not block or not self._cond.wait_for(lambda: self.head < len(self.chunks), timeout):
+          raise queue.Empty
+      start, end, t_ns = self.chunks[self.head]
+      self.head += 1
+      self.got = end
+      s = start % self.size
+      return t_ns, self.view[s:s + end - start]
+
+  def get_nowait(self):
+    return self.get(False)
+
+  def release(self):
+    """Free the space of all chunks got so far, their views are invalid."""
+    with self._cond:
+      if self.freed != self.got:
+        self.freed = self.got
+        self._compact()
+        self._cond.notify_all()
+
+  def qsize(self):
+    return len(self.chunks) - self.head
+
+  def empty(self):
+    return self.qsize() == 0
+
+  def pending(self):
+    """Bytes committed but not got yet."""
+    return self.written - self.got
+
+  def report(self):
+    return 'RX ring %d KB, %d overflows, %d bytes %s, %.3f s waited' % (
+           self.size // 1024, self.overflows, self.dropped,
+           'spilled' if self.overflow == 'spill' else 'dropped', self.waited)
+
+  def close(self):
+    if self._spill:
+      self._spill.close()
+      self._spill = None
+
+  def _compact(self):
+    # forget the chunks that were got, in batches so it stays cheap
+    if self.head > 1024 or self.head == len(self.chunks):
+      del self.chunks[:self.head]
+      self.head = 0
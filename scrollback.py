@@ -0,0 +1,96 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# scrollback.py     bounded line store behind the Bt3 terminal window
+#
+
+import collections
+
+
+class Scrollback(object):
+  """Scrollback - A bounded store of received lines.
+
+     Keeps at most max_lines lines and, when set, max_chars characters.
+     Lines pushed out at the top are appended to the file spill_path when
+     given, otherwise they are dropped. Every line is a tuple of (text, tag)
+     segments, the line that is still being received is kept in tail.
+  """
+  def __init__(self, max_lines=100000, max_chars=None, spill_path=None):
+    self.max_lines = max_lines
+    self.max_chars = max_chars
+    self.spill_path = spill_path
+    self._spill = None
+    self.clear()
+
+  def clear(self):
+    """Drop all lines, the spill file is left as is."""
+    self.lines = collections.deque()
+    self.tail = []
+    self.chars = 0
+    self.first = 0      # absolute number of the oldest line still held
+    self.dropped = 0    # lines dropped or spilled since the start
+
+  def __len__(self):
+    return len(self.lines) + (1 if self.tail else 0)
+
+  def append(self, text, tag):
+    """Append text, which may hold any number of newlines."""
+    parts = text.split('\n')
+    for part in parts[:-1]:
+      if part:
+        self.tail.append((part, tag))
+      self.lines.append(tuple(self.tail))
+      self.chars += sum(len(t) for t, _ in self.tail) + 1
+      self.tail = []
+
+    if parts[-1]:
+      self.tail.append((parts[-1], tag))
+
+    self._trim()
+
+  def get(self, start, count):
+    """Return count lines from relative line start, tail included."""
+    n = len(self.lines)
+    rows = [self.lines[i] for i in range(max(0, start), min(n, start + count))]
+    if self.tail and start + count > n:
+      rows.append(tuple(self.tail))
+    return rows
+
+  def close(self):
+    if self._spill:
+      self._spill.close()
+      self._spill = None
+
+  def _trim(self):
+    spilled = []
+    while self.lines and (len(self.lines) > self.max_lines or
+                          (self.max_chars and self.chars > self.max_chars)):
+      line = self.lines.popleft()
+      self.chars -= sum(len(t) for t, _ in line) + 1
+      self.first += 1
+      self.dropped += 1
+      if self.spill_path:
+        spilled.append(''.join(t for t, _ in line))
+
+    if spilled:
+      if not self._spill:
+        self._spill = open(self.spill_path, 'a')
+      self._spill.write('\n'.join(spilled) + '\n')
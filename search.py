@@ -0,0 +1,196 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# search.py     search in the received byte stream of Bt3
+#
+# The raw RX bytes are kept next to the rendered scrollback, queries run
+# over the bytes instead of the hexdump text. Anchors map a stream offset
+# to the scrollback line it is shown on, so matches can be highlighted.
+#
+
+import re
+import bisect
+from array import array
+
+from support import unescape
+
+KINDS = ('bytes', 'hex', 'regex')
+
+# text columns of the hex and ascii part of a HexDumper row, '%08X  %s%s'
+HEX_COL = 10
+ASCII_COL = HEX_COL + 56
+
+
+def compile_query(text, kind='bytes'):
+  # return the bytes regex of a query, kind is one of KINDS:
+  #   bytes   escaped bytes like \x7E\x01, matched exactly
+  #   hex     hex digits, ?? matches any byte, like "7E ?? 01"
+  #   regex   a regular expression over the bytes
+  # raises ValueError for an invalid query.
+  if not text:
+    raise ValueError('Empty query.')
+  try:
+    if kind == 'bytes':
+      return re.compile(re.escape(unescape(text)))
+    if kind == 'hex':
+      digits = ''.join(text.split())
+      if len(digits) % 2:
+        raise ValueError('Odd number of hex digits in %s.' % text)
+      return re.compile(b''.join([b'.' if digits[i:i + 2] == '??' else re.escape(bytes.fromhex(digits[i:i + 2]))
+                                  for i in range(0, len(digits), 2)]), re.DOTALL)
+    if kind == 'regex':
+      return re.compile(text.encode('latin-1'), re.DOTALL)
+  except re.error as E:
+    raise ValueError('Invalid regex: %s' % E)
+  raise ValueError('Unknown query kind %s.' % kind)
+
+
+class StreamIndex(object):
+  """StreamIndex - The received byte stream, searchable and mapped to lines.
+
+     Holds the last max_bytes bytes, offsets count from the first byte
+     appended after clear(). An anchor tells which scrollback line the
+     bytes from its offset on are shown on: either as hexdump rows that
+     start at a column, or as a frame filling a number of whole lines.
+  """
+  def __init__(self, max_bytes=128 * 1024 * 1024):
+    self.max_bytes = max_bytes
+    self.clear()
+
+  def clear(self):
+    """Drop the stream and the anchors, offsets restart at 0."""
+    self.buf = bytearray()
+    self.start = 0             # stream offset of buf[0]
+    self.offsets = array('q')  # anchor stream offsets, ascending
+    self.lines = array('q')    # absolute scrollback line of each anchor
+    self.cols = array('l')     # hexdump column of the anchor byte, or -lines of a frame
+
+  @property
+  def end(self):
+    return self.start + len(self.buf)
+
+  def append(self, bytes_val):
+    self.buf += bytes_val
+    if len(self.buf) > self.max_bytes:
+      self._trim(len(self.buf) - self.max_bytes + self.max_bytes // 8)
+
+  def anchor_row(self, offset, line, col):
+    """Bytes from offset on are hexdump rows from line on, the first at col."""
+    self._anchor(offset, line, col)
+
+  def anchor_frame(self, offset, line, lines=1):
+    """Bytes from offset on are a frame shown on lines lines from line on."""
+    self._anchor(offset, line, -max(1, lines))
+
+  def _anchor(self, offset, line, col):
+    if self.offsets and self.offsets[-1] == offset:
+      # nothing was shown for the previous anchor
+      self.lines[-1] = line
+      self.cols[-1] = col
+    else:
+      self.offsets.append(offset)
+      self.lines.append(line)
+      self.cols.append(col)
+
+  def spans(self, offset, length):
+    """Return the (line, first column, end column) text spans of the bytes,
+       end column None marks a whole line."""
+    spans = []
+    end = offset + length
+    n = len(self.offsets)
+    i = bisect.bisect_right(self.offsets, offset) - 1
+    while offset < end:
+      if i < 0:
+        # before the first anchor, not on screen
+        offset = self.offsets[0] if n else end
+        i = 0
+        continue
+      limit = min(end, self.offsets[i + 1] if i + 1 < n else end)
+      col = self.cols[i]
+      if col < 0:
+        spans.extend([(self.lines[i] + k, 0, None) for k in range(-col)])
+        offset = limit
+      else:
+        pos = col + offset - self.offsets[i]
+        c = pos % 16
+        cnt = min(16 - c, limit - offset)
+        line = self.lines[i] + pos // 16
+        spans.append((line, HEX_COL + 3 * c, HEX_COL + 3 * (c + cnt) - 1))
+        spans.append((line, ASCII_COL + c, ASCII_COL + c + cnt))
+        offset += cnt
+      if offset >= limit:
+        i += 1
+    return spans
+
+  def _trim(self, cnt):
+    # drop the oldest cnt bytes, and the anchors only they used
+    del self.buf[:cnt]
+    self.start += cnt
+    i = bisect.bisect_right(self.offsets, self.start) - 1
+    if i > 0:
+      del self.offsets[:i]
+      del self.lines[:i]
+      del self.cols[:i]
+
+
+class Search(object):
+  """Search - The matches of a query in a StreamIndex.
+
+     update() scans only what was appended since the last update, so a
+     search can follow a growing stream. Matches spanning the boundary
+     are found when they are shorter than overlap bytes.
+  """
+  def __init__(self, index, pattern, overlap=4096):
+    self.index = index
+    self.pattern = pattern
+    self.overlap = overlap
+    self.starts = array('q')
+    self.ends = array('q')
+    self.scanned = index.start
+
+  def __len__(self):
+    return len(self.starts)
+
+  def update(self):
+    """Scan the new bytes, return the number of matches."""
+    idx = self.index
+    # matches of trimmed bytes are gone
+    i = bisect.bisect_left(self.starts, idx.start)
+    if i:
+      del self.starts[:i]
+      del self.ends[:i]
+
+    pos = max(idx.start, self.scanned - self.overlap, self.ends[-1] if self.ends else 0)
+    for m in self.pattern.finditer(idx.buf, pos - idx.start):
+      if m.end() > m.start():
+        self.starts.append(idx.start + m.start())
+        self.ends.append(idx.start + m.end())
+    self.scanned = idx.end
+    return len(self.starts)
+
+  def find(self, offset, step=1):
+    """Return the number of the first match after offset, or before it with
+       step -1, None if there is none."""
+    if step > 0:
+      i = bisect.bisect_right(self.starts, offset)
+      return i if i < len(self.starts) else None
+    i = bisect.bisect_left(self.starts, offset) - 1
+    return i if i >= 0 else None
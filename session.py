@@ -0,0 +1,107 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# session.py     several ports in one Bt3 process
+#
+# A Session owns a Terminal per port, each with its own settings, checksum
+# options and capture port id, all served by one PortSelector I/O thread.
+#
+
+import queue
+import collections
+
+from terminal import Terminal, PortSelector
+
+
+def parse_spec(spec):
+  """Split DEVICE[,key=value...] into the device and a dict of the keys."""
+  fields = spec.split(',')
+  return fields[0], dict(f.split('=', 1) for f in fields[1:])
+
+
+def port_settings(opts, defaults):
+  """Return the port settings of the keys in opts, the unset ones are taken
+     from defaults, e.g. Terminal.settings."""
+  settings = {'speed': int(opts.get('speed', defaults['speed'])),
+              'databits': int(opts.get('databits', defaults['databits'])),
+              'parity': opts.get('parity', defaults['parity']),
+              'stopbits': float(opts.get('stopbits', defaults['stopbits'])),
+              'flow': opts.get('flow', defaults['flow'])}
+  if settings['stopbits'] == int(settings['stopbits']):
+    settings['stopbits'] = int(settings['stopbits'])
+  return settings
+
+
+class PortQueue(object):
+  # stands in for Terminal.rxQ, tags chunks with the port name and puts
+  # them in the queue shared by the session
+  def __init__(self, rxQ, name):
+    self.rxQ = rxQ
+    self.name = name
+
+  def put(self, item):
+    t_ns, bytes_val = item
+    self.rxQ.put((t_ns, self.name, bytes_val))
+
+  def qsize(self):
+    # depth of the shared queue, all ports of the session
+    return self.rxQ.qsize()
+
+  def empty(self):
+    return self.rxQ.empty()
+
+
+class Session(object):
+  """Session - Terminals for several ports sharing one I/O thread.
+
+     With merged set, chunks of all ports arrive in rxQ as tuples of
+     (t_ns, name, bytes) in the order they were read, which interleaves
+     them by time. Otherwise every Terminal keeps its own rxQ.
+  """
+  def __init__(self, merged=True):
+    self.selector = PortSelector()
+    self.terms = collections.OrderedDict()
+    self.merged = merged
+    self.rxQ = queue.Queue()
+
+  def add(self, name, settings=None):
+    """Add a Terminal for port name, settings update its defaults."""
+    term = Terminal()
+    term.settings['device'] = name
+    term.settings.update(settings or {})
+    if self.merged:
+      term.rxQ = PortQueue(self.rxQ, name)
+    self.terms[name] = term
+    return term
+
+  def connect(self):
+    """Connect all ports, returns True if all of them connected."""
+    return all([term.connect(self.selector) for term in self.terms.values()])
+
+  def disconnect(self):
+    for term in self.terms.values():
+      if term.is_open:
+        term.disconnect()
+    self.selector.stop()
+
+  @property
+  def connected(self):
+    return any(term.connected for term in self.terms.values())
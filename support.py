@@ -92,6 +92,11 @@ class EntryHistory(object):
 
 
 
+def unescape(entry):
+  # return the bytes of an escaped entry like "\x7E\x01"
+  return bytes(entry, 'ascii').decode('unicode_escape').encode('latin-1')
+
+
 def achr(n):
   # return chr(n) if displayable ascii, '.' otherwise.
   if 32 < n < 126:
@@ -101,32 +106,88 @@ def achr(n):
   return c
 
 
+# byte -> ascii column character, see achr()
+ACHR_TABLE = bytes(n if 32 < n < 126 else 0x2E for n in range(256))
+
+
+def _hex_rows(bytes_val, offset, fmt):
+  # return hexdump rows of bytes_val starting at stream offset, a row that
+  # starts mid-row is padded so the bytes line up with their columns.
+  rows = []
+  col = offset % 16
+  if col and bytes_val:
+    row = bytes(bytes_val[:16 - col])
+    rows.append(fmt % (offset - col,
+                       ('   ' * col + row.hex(' ').upper()).ljust(56),
+                       ' ' * col + row.translate(ACHR_TABLE).decode('ascii')))
+    bytes_val = bytes_val[len(row):]
+    offset += len(row)
+
+  if bytes_val:
+    # convert the whole block at once and slice the rows out of it
+    h = bytes_val.hex(' ').upper()
+    a = bytes(bytes_val).translate(ACHR_TABLE).decode('ascii')
+    rows.extend([fmt % (offset + i, h[3*i:3*i + 47].ljust(56), a[i:i + 16])
+                 for i in range(0, len(bytes_val), 16)])
+
+  return ''.join(rows)
+
+
 def hex_dump(bytes_val):
   # return \n separated lines hexdump (index word + 16 data bytes + ascii column) of bytes
-  hex_val = [bytes_val[i:i+16] for i in range(0, len(bytes_val), 16)]
+  return _hex_rows(bytes_val, 0, '%04X  %s%s\n')
+
 
-  cnt = 0
-  dump = []
-  for row in hex_val:
-    dump.append('%04X  %s%s\n' % (cnt, ''.join(['%02X '% x for x in row]).strip().ljust(56), ''.join([achr(c) for c in row])))
-    cnt = cnt + 16
+class HexDumper(object):
+  """HexDumper - A hexdump of a byte stream fed in chunks.
 
-  return ''.join(dump)
+     The offset column keeps running across chunks. feed() only returns
+     complete rows and holds back the bytes of a partial row, flush()
+     returns the held back bytes as a partial row. Rows following a
+     flushed partial row start mid-row at the right column.
+  """
+  def __init__(self, fmt='%08X  %s%s\n'):
+    self.fmt = fmt
+    self.reset()
+
+  def reset(self):
+    """Restart the offset column at 0."""
+    self.offset = 0
+    self.pending = b''
+
+  def feed(self, bytes_val):
+    """Return the complete rows available after adding bytes_val."""
+    if self.pending:
+      bytes_val = self.pending + bytes_val
+    end = self.offset + len(bytes_val)
+    cnt = max(0, end - end % 16 - self.offset)
+    self.pending = bytes(bytes_val[cnt:])
+    text = _hex_rows(bytes_val[:cnt], self.offset, self.fmt)
+    self.offset += cnt
+    return text
+
+  def flush(self):
+    """Return the held back bytes as a partial row."""
+    text = _hex_rows(self.pending, self.offset, self.fmt)
+    self.offset += len(self.pending)
+    self.pending = b''
+    return text
 
 
 def sum_mod(bytes_val):
   # return 2's complement (modulo) checksum of bytes
-  d = (255 - (sum(bytes_val) % 256)) + 1
-  if (d > 255):
-      d = 0
-  return d
+  return -sum(bytes_val) & 0xFF
 
 
 def sum_xor(bytes_val):
-  # return xor sum of bytes
-  x = 0
-  for b in bytes_val:
-    x = x ^ b
+  # return xor sum of bytes, folding the bytes as one integer in halves
+  # so the work is done by a few big integer operations
+  n = len(bytes_val)
+  x = int.from_bytes(bytes(bytes_val), 'little')
+  while n > 1:
+    h = (n + 1) // 2
+    x = (x & ((1 << 8*h) - 1)) ^ (x >> 8*h)
+    n = h
   return x
 
 
@@ -135,3 +196,53 @@ def get_timecode():
   return '%04d%02d%02dT%02d%02d%02dZ' % (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
 
 
+class Timecode(object):
+  """Timecode - Formats time.monotonic_ns() stamps as UTC timecodes.
+
+     resolution is one of RESOLUTIONS. The date and time of day part is
+     cached per second, so gmtime() runs once a second at most.
+  """
+  RESOLUTIONS = {'s': 0, 'ms': 3, 'us': 6}
+
+  def __init__(self, resolution='s'):
+    self.offset = time.time_ns() - time.monotonic_ns()
+    self.resolution = resolution
+    self._sec = None
+    self._prefix = ''
+
+  @property
+  def resolution(self):
+    return self._resolution
+
+  @resolution.setter
+  def resolution(self, resolution):
+    self._resolution = resolution
+    self._digits = self.RESOLUTIONS[resolution]
+    self._div = 10 ** (9 - self._digits)
+
+  def format(self, t_ns):
+    """Return the timecode of monotonic t_ns."""
+    sec, frac = divmod(t_ns + self.offset, 1000000000)
+    if sec != self._sec:
+      t = time.gmtime(sec)
+      self._sec = sec
+      self._prefix = '%04d%02d%02dT%02d%02d%02d' % (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+    if self._digits:
+      return '%s.%0*dZ' % (self._prefix, self._digits, frac // self._div)
+    return self._prefix + 'Z'
+
+
+_numpy = False
+
+
+def numpy_module():
+  # return numpy, or None when it is not installed. it is imported on the
+  # first call, importing it takes longer than the rest of the startup.
+  global _numpy
+  if _numpy is False:
+    try:
+      import numpy
+    except ImportError:
+      numpy = None
+    _numpy = numpy
+  return _numpy
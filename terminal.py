@@ -0,0 +1,476 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# terminal.py     serial port model of Bt3, independent of the GUI
+#
+
+import os
+import time
+import threading
+import select
+import selectors
+import collections
+import serial
+
+from support import Observable
+from checksum import CHECKSUMS
+import capture
+from txwriter import TxWriter
+from ring import RxRing
+
+
+class Terminal(object):
+  threaded_tx = True           # write through a TxWriter thread
+
+  def __init__(self):
+    self._serial = serial.Serial()
+
+    self.options = {'device': [],
+                    'speed': self._serial.BAUDRATES,
+                    'databits': self._serial.BYTESIZES,
+                    'parity': self._serial.PARITIES,
+                    'stopbits': self._serial.STOPBITS,
+                    'flow': ['hardware', 'software', 'None']}
+
+    self.settings = {'device': '',
+                     'speed': 115200,
+                     'databits': 8,
+                     'parity': 'N',
+                     'stopbits': 1,
+                     'flow': 'None'}
+
+    # options['device'] is filled in from a discovery.PortWatcher
+
+    self.tx_cache = collections.OrderedDict()  # entry -> wire bytes, see compile()
+    self.tx_cache_size = 256
+
+    self.sum_type = ''         # checksum type, a key of CHECKSUMS
+    self.echo_enable = True    # enable local echo
+    self.lf_enable = False     # add line feed
+    self.cr_enable = False     # add carriage return
+    self.status = Observable() # observe status msg
+    self.echo = Observable()   # observe local echo
+    self.connected = False     # status
+    self._rxQ = None           # received (t_ns, chunk), see rxQ
+    self.rx_timeout = 0.1      # max time the listener blocks before checking for disconnect
+    self.capture = None        # capture.CaptureWriter, records RX and TX when set
+    self.capture_port = 0      # port id of this terminal in the capture
+    self.selector = None       # PortSelector serving the port, if any
+    self.tx = None             # TxWriter of the open port
+    self.tx_queue_size = 1024  # frames queued before send() pushes back
+    self.tx_chunk = 256        # max bytes per port write
+    self.char_gap = 0.0        # seconds between transmitted characters
+    self.frame_gap = 0.0       # seconds between transmitted frames
+    self.rx_bytes = 0          # bytes received since start, see metrics.py
+    self.rx_chunks = 0         # reads that returned data
+    self.responder = None      # triggers.Responder answering RX patterns from the receiving thread
+    self.bridge = None         # bridge.Bridge sharing the port with TCP clients
+    self.stats = None          # linkstats.LinkStats fed with every received chunk
+
+
+  def listener(self):
+    # listening thread, blocks on the port until the first byte arrives and
+    # then takes whatever else is already waiting in one read.
+    self._serial.timeout = self.rx_timeout
+    ring = self.rxQ if isinstance(self.rxQ, RxRing) and hasattr(os, 'readv') else None
+    while self.connected and self._serial.isOpen():
+      try:
+        if ring:
+          self._read_ring(ring)
+          continue
+        data = self._serial.read(1)
+        if data:
+          cnt = self._serial.inWaiting()
+          if cnt:
+            data += self._serial.read(cnt)
+          self._received(data, time.monotonic_ns())
+      except (serial.SerialException, OSError) as ex:
+        self._read_error(ex)
+        break
+
+    self.connected = False
+
+
+  def _read_ring(self, ring):
+    # read what is waiting straight into the free space of ring, no bytes
+    # object is made. waits up to rx_timeout for space and for data.
+    view = ring.writable(self.rx_timeout)
+    if not view:
+      return
+    fd = self._serial.fileno()
+    if not select.select([fd], [], [], self.rx_timeout)[0]:
+      return
+    try:
+      n = os.readv(fd, [view])
+    except (BlockingIOError, InterruptedError):
+      return
+    if not n:
+      raise serial.SerialException('device reports readiness to read but returned no data (device disconnected?)')
+    t_ns = time.monotonic_ns()
+    self._tap(view[:n], t_ns)
+    ring.commit(n, t_ns)
+
+
+  def receive(self):
+    # read what is waiting at the port without blocking, called by a
+    # PortSelector when the port is readable. returns False on failure.
+    try:
+      data = self._serial.read(max(1, self._serial.inWaiting()))
+    except (serial.SerialException, OSError) as ex:
+      self._read_error(ex)
+      self.connected = False
+      return False
+
+    if data:
+      self._received(data, time.monotonic_ns())
+    return True
+
+
+  def inject(self, data):
+    # hand data to the receive path as if it was just read from the port
+    self._received(data, time.monotonic_ns())
+
+
+  def _received(self, data, t_ns):
+    # t_ns is the monotonic time the read returned, i.e. when the last
+    # byte of data was there
+    self._tap(data, t_ns)
+    self.rxQ.put((t_ns, data))
+
+
+  def rx_release(self):
+    # the chunks taken from rxQ so far are done with, their space in the
+    # RxRing can be reused
+    if isinstance(self.rxQ, RxRing):
+      self.rxQ.release()
+
+
+  def _tap(self, data, t_ns):
+    # everything that sees a chunk before it is queued, on the receiving thread
+    if self.capture:
+      self.capture.write(capture.RX, self.capture_port, data, t_ns)
+    self.rx_bytes += len(data)
+    self.rx_chunks += 1
+    if self.responder:
+      self.responder.feed(data, t_ns)
+    if self.bridge:
+      self.bridge.feed(data)
+    stats = self.stats     # the Tk thread may drop it meanwhile, see TermPresenter.on_stats()
+    if stats:
+      stats.feed(data, t_ns)
+
+
+  def char_time(self):
+    # return the time on the wire of one character in ns
+    bits = 1 + self.settings['databits'] + (self.settings['parity'] != 'N') + self.settings['stopbits']
+    return int(bits * 1e9 / self.settings['speed'])
+
+
+  def _read_error(self, ex):
+    if self.connected:
+      self.status.set('Error while reading from %s:\n%s' % (self.settings['device'], str(ex)))
+
+
+  def _write_error(self, ex):
+    # called by the TxWriter, which stopped
+    if self.connected:
+      self.status.set('Error while writing to %s:\n%s' % (self.settings['device'], str(ex)))
+
+
+  def fileno(self):
+    return self._serial.fileno()
+
+
+  @property
+  def is_open(self):
+    # the port is open, connected or not: after a read error the listener
+    # is gone but disconnect() still has the writer to stop
+    return self._serial.isOpen()
+
+
+  def connect(self, selector=None):
+    # with a PortSelector the port is served by its I/O thread instead of
+    # a listener thread of its own
+    self.selector = selector
+    if self.capture:
+      self.capture_port = self.capture.port_id(self.settings['device'])
+    if self.responder:
+      self.responder.reset()
+    if self.stats:
+      self.stats.restart(self.char_time())
+
+    self._serial.port =     self.settings['device']
+    self._serial.baudrate = self.settings['speed']
+    self._serial.bytesize = self.settings['databits']
+    self._serial.parity =   self.settings['parity']
+    self._serial.stopbits = self.settings['stopbits']
+    self._serial.rtscts =   self.settings['flow'] == 'hardware'
+    self._serial.xonxoff =  self.settings['flow'] == 'software'
+
+    try:
+      self._serial.open()
+    except (serial.SerialException, ValueError) as ex:
+      self.status.set('Error while connecting to %s:\n%s' % (self.settings['device'], str(ex)))
+    else:
+      if (self._serial.isOpen()):
+        self.status.set('Connected to %s (%d/%d/%s/%d).' % (self.settings['device'],
+                                                             self.settings['speed'],
+                                                             self.settings['databits'],
+                                                             self.settings['parity'],
+                                                             self.settings['stopbits']))
+        self.connected = True
+        if self.threaded_tx:
+          self.tx = TxWriter(self._serial, self._sent, self.tx_queue_size, self.tx_chunk,
+                             self.char_gap, self.frame_gap, self._write_error)
+          self.tx.start()
+        if self.selector:
+          self._serial.timeout = 0
+          self.selector.add(self)
+        else:
+          # start the listener
+          self.rx_thd = threading.Thread(target=self.listener)
+          self.rx_thd.setDaemon(True)
+          self.rx_thd.start()
+      else:
+        self.status.set('Unable to open %s.' % self.settings['device'])
+
+    return self.connected
+
+
+  def disconnect(self):
+    self.connected = False
+    if self.tx:
+      self.tx.stop()
+      self.status.set(self.tx.report())
+    if isinstance(self._rxQ, RxRing):
+      self._rxQ.close()
+      if self._rxQ.overflows:
+        self.status.set(self._rxQ.report())
+    if self.responder and self.responder.rules:
+      self.status.set('Triggers\n' + self.responder.report())
+    if self.selector:
+      self.selector.remove(self)
+    else:
+      self._serial.cancel_read()
+      self.rx_thd.join()
+    self._serial.close()
+    self.status.set('Serial device closed.')
+
+
+  # the receive queue, a 4 MB RxRing allocated on first use unless it was
+  # replaced before, e.g. by a queue.Queue of bytes which works as well
+  @property
+  def rxQ(self):
+    if self._rxQ is None:
+      self._rxQ = RxRing(4 << 20)
+    return self._rxQ
+
+  @rxQ.setter
+  def rxQ(self, rxQ):
+    self._rxQ = rxQ
+
+
+  # the frame options, changing one drops the compiled frames
+  @property
+  def cr_enable(self):
+    return self._cr_enable
+
+  @cr_enable.setter
+  def cr_enable(self, enable):
+    self._cr_enable = enable
+    self.tx_cache.clear()
+
+  @property
+  def lf_enable(self):
+    return self._lf_enable
+
+  @lf_enable.setter
+  def lf_enable(self, enable):
+    self._lf_enable = enable
+    self.tx_cache.clear()
+
+  @property
+  def sum_type(self):
+    return self._sum_type
+
+  @sum_type.setter
+  def sum_type(self, sum_type):
+    self._sum_type = sum_type
+    self.tx_cache.clear()
+
+
+  def frame(self, line):
+    # return line as it goes out on the wire, with CR/LF and checksum
+    b = line.encode('latin-1')
+
+    if self.cr_enable:
+      b += b'\r'
+    if self.lf_enable:
+      b += b'\n'
+
+    if self.sum_type in CHECKSUMS:
+      b += CHECKSUMS[self.sum_type].digest(b)
+
+    return b
+
+
+  def compile(self, entry):
+    # return the wire bytes of an escaped entry like "\x00\x01", the last
+    # tx_cache_size entries are kept so repeated sends skip all encoding
+    b = self.tx_cache.get(entry)
+    if b is None:
+      b = self.frame(bytes(entry, 'ascii').decode('unicode_escape'))
+      self.tx_cache[entry] = b
+      if len(self.tx_cache) > self.tx_cache_size:
+        self.tx_cache.popitem(last=False)
+    else:
+      self.tx_cache.move_to_end(entry)
+    return b
+
+
+  def talk(self, line):
+    if self.connected:
+      self.send(self.frame(line))
+    else:
+      self.status.set('Not connected.')
+
+
+  def talk_entry(self, entry, block=False):
+    # like talk(), for an escaped entry
+    if self.connected:
+      self.send(self.compile(entry), block)
+    else:
+      self.status.set('Not connected.')
+
+
+  def send(self, b, block=False, timeout=None):
+    # queue the wire bytes b of a frame built by frame() for the writer,
+    # with block the caller waits for room in a full queue. returns False
+    # when the frame was refused.
+    if not self.connected:
+      return False
+    if not self.tx:
+      self._serial.write(b)
+      self._sent(b)
+      return True
+    if not self.tx.put(b, block, timeout):
+      if not block:
+        self.status.set('TX queue full, frame dropped.' if self.tx.active else 'TX stopped, frame dropped.')
+      return False
+    return True
+
+
+  def tx_full(self):
+    # True while send() without block would refuse a frame
+    return bool(self.tx) and self.tx.txQ.full()
+
+
+  def respond(self, b):
+    # write the wire bytes b right away, ahead of the TX queue. called by
+    # the responder from the receiving thread.
+    if self.tx:
+      self.tx.urgent(b)
+      return
+    try:
+      self._serial.write(b)
+    except (serial.SerialException, OSError) as ex:
+      self._write_error(ex)
+    else:
+      self._sent(b)
+
+
+  def _sent(self, b):
+    # called once frame b is written
+    if self.echo_enable:
+      self.echo.set(b)
+
+    if self.capture:
+      self.capture.write(capture.TX, self.capture_port, b)
+
+
+
+class PortSelector(object):
+  """PortSelector - One I/O thread receiving for any number of Terminals.
+
+     A Terminal connected with a selector registers its port here instead
+     of starting a listener thread. Readable ports are served in the order
+     the selector reports them. Ports need a fileno(), i.e. POSIX.
+  """
+  def __init__(self):
+    self._sel = selectors.DefaultSelector()
+    self._wake_r, self._wake_w = os.pipe()
+    self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+    self._lock = threading.Lock()
+    self._pending = []
+    self.active = False
+    self.thd = None
+
+  def add(self, term):
+    """Start serving term, starts the I/O thread if needed."""
+    self._request('add', term)
+
+  def remove(self, term):
+    """Stop serving term, returns once the I/O thread let go of it."""
+    self._request('remove', term).wait()
+
+  def stop(self):
+    """Stop the I/O thread, the ports are left as they are."""
+    if self.thd:
+      self._request('stop', None).wait()
+      self.thd.join()
+      self.thd = None
+
+  def run(self):
+    while self.active:
+      for key, _ in self._sel.select():
+        if key.data is None:
+          os.read(self._wake_r, 512)
+          self._apply()
+        elif not key.data.receive():
+          self._sel.unregister(key.fileobj)
+
+  def _request(self, op, term):
+    done = threading.Event()
+    with self._lock:
+      self._pending.append((op, term, done))
+      if not self.thd:
+        self.active = True
+        self.thd = threading.Thread(target=self.run)
+        self.thd.daemon = True
+        self.thd.start()
+    os.write(self._wake_w, b'\x00')
+    return done
+
+  def _apply(self):
+    # registration changes are made on the I/O thread only
+    with self._lock:
+      pending, self._pending = self._pending, []
+    for op, term, done in pending:
+      if op == 'add':
+        self._sel.register(term.fileno(), selectors.EVENT_READ, term)
+      elif op == 'remove':
+        try:
+          self._sel.unregister(term.fileno())
+        except (KeyError, ValueError):
+          pass    # already dropped after a read error
+      else:
+        self.active = False
+      done.set()
@@ -22,20 +22,165 @@
 # termview.py     tkinter GUI for Bt3
 #
 
+import os
 import tkinter as tk
 from tkinter import ttk, font
-from PIL import ImageTk, Image
+
+from scrollback import Scrollback
+
+ICON_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 class TermView(ttk.tkinter.Tk):
   def __init__(self, *args, **kwargs):
     ttk.tkinter.Tk.__init__(self, *args, **kwargs)
+    self.scrollback = Scrollback()
+    self.rows = 24         # lines that fit in output_text
+    self.top = 0           # first line on screen, relative to the scrollback
+    self.follow = True     # keep the last line on screen
+    self._first = 0
+    self.marks = {}        # absolute line -> [(first column, end column)] highlighted, see mark()
     self._init_gui()
+    self.bind('<Map>', self._on_map)
+
+
+  def _on_map(self, event):
+    # the window is up, decode the icons once it has been drawn
+    if event.widget is self:
+      self.unbind('<Map>')
+      self.after_idle(self.load_icons)
+
+
+  def load_icons(self):
+    # Tk reads PNG itself from 8.6 on, PIL is only imported for older
+    # versions. a button whose icon can not be read shows its name.
+    for wgt, name in self.icons:
+      path = os.path.join(ICON_DIR, name)
+      try:
+        ico = tk.PhotoImage(file=path)
+      except tk.TclError:
+        try:
+          from PIL import ImageTk, Image
+          ico = ImageTk.PhotoImage(Image.open(path))
+        except (ImportError, OSError):
+          wgt.config(text=os.path.splitext(name)[0], compound=tk.CENTER)
+          continue
+      wgt.config(image=ico)
+      wgt.image = ico    # Tk does not hold a reference
+
+
+  @property
+  def end_line(self):
+    # absolute number of the line the next put_line() starts on
+    return self.scrollback.first + len(self.scrollback.lines)
+
+
+  def has_line(self, line):
+    return self.scrollback.first <= line <= self.end_line
+
+
+  def mark(self, spans):
+    # highlight the (line, first column, end column) spans, end column None
+    # for the whole line, and bring the first one on screen
+    self.marks = {}
+    for line, first, end in spans:
+      self.marks.setdefault(line, []).append((first, end))
+    if spans and self.has_line(spans[0][0]):
+      self.scroll_to(spans[0][0] - self.scrollback.first - self.rows // 2)
+    else:
+      self.render()
+
+
+  def show_stats(self, enabled):
+    if enabled:
+      self.stats_text.pack(side=tk.RIGHT, fill=tk.Y, before=self.output_scroll)
+    else:
+      self.stats_text.pack_forget()
+
+
+  def set_stats(self, text):
+    self.stats_text.config(state='normal')
+    self.stats_text.delete('1.0', tk.END)
+    self.stats_text.insert(tk.END, text)
+    self.stats_text.config(state='disabled')
 
 
   def put_line(self, line, tag):
-    self.output_text.insert('end', line, tag)
-    self.output_text.see(tk.END)
+    self.scrollback.append(line, tag)
+    if self.follow:
+      self.render()
+    else:
+      # lines dropped at the top shift the view
+      self.top = max(0, self.top - (self.scrollback.first - self._first))
+      self._first = self.scrollback.first
+      self._set_scroll()
+
+
+  def clear(self):
+    self.scrollback.clear()
+    self.marks = {}
+    self.follow = True
+    self.render()
+
+
+  def render(self):
+    # only the lines on screen live in the text widget
+    total = len(self.scrollback)
+    if self.follow:
+      self.top = max(0, total - self.rows)
+    self._first = self.scrollback.first
+
+    segments = []
+    for i, line in enumerate(self.scrollback.get(self.top, self.rows)):
+      if i:
+        segments.extend(('\n', ()))
+      for text, tag in line:
+        segments.extend((text, tag))
+
+    self.output_text.delete('1.0', tk.END)
+    if segments:
+      self.output_text.insert(tk.END, *segments)
+    first = self.scrollback.first + self.top
+    for line in range(first, first + self.rows):
+      for start, end in self.marks.get(line, ()):
+        row = line - first + 1
+        self.output_text.tag_add('match', '%d.%d' % (row, start), '%d.%s' % (row, 'end' if end is None else end))
+    if self.follow:
+      self.output_text.see(tk.END)
+    self._set_scroll()
+
+
+  def scroll_to(self, top):
+    total = len(self.scrollback)
+    self.top = max(0, min(int(top), total - self.rows))
+    self.follow = self.top >= total - self.rows
+    self.render()
+
+
+  def _set_scroll(self):
+    total = max(1, len(self.scrollback))
+    self.output_scroll.set(self.top / total, min(1.0, (self.top + self.rows) / total))
+
+
+  def _on_yview(self, cmd, *args):
+    if cmd == 'moveto':
+      self.scroll_to(float(args[0]) * len(self.scrollback))
+    elif cmd == 'scroll':
+      step = self.rows if args[1] == 'pages' else 1
+      self.scroll_to(self.top + int(args[0]) * step)
+
+
+  def _on_wheel(self, event):
+    if event.num == 4 or event.delta > 0:
+      self.scroll_to(self.top - 3)
+    else:
+      self.scroll_to(self.top + 3)
+    return 'break'
+
+
+  def _on_resize(self, event):
+    self.rows = max(1, event.height // self.text_font.metrics('linespace'))
+    self.render()
 
 
   def _init_gui(self):
@@ -50,49 +195,66 @@ class TermView(ttk.tkinter.Tk):
     self.toggle_xor = tk.BooleanVar()
     self.toggle_rep = tk.BooleanVar()
     self.toggle_time = tk.BooleanVar()
+    self.toggle_stats = tk.BooleanVar()
     self.port_set = tk.StringVar()
     self.baud_set = tk.IntVar()
     self.bits_set = tk.IntVar()
     self.pary_set = tk.StringVar()
     self.stop_set = tk.DoubleVar()
+    self.flow_set = tk.StringVar()
+    self.busy_var = tk.StringVar()
+    self.frame_set = tk.StringVar()
+    self.check_set = tk.StringVar()
+    self.sum_set = tk.StringVar()
+    self.res_set = tk.StringVar()
+    self.rate_set = tk.StringVar()
+    self.metrics_var = tk.StringVar()
+    self.search_var = tk.StringVar()
+    self.search_kind = tk.StringVar()
+    self.search_info = tk.StringVar()
 
     # Toolbar
     self.toolbar = ttk.Frame(self)
 
-    self.open_ico = ImageTk.PhotoImage(Image.open('open.png'))
+    # the icons are decoded by load_icons() once the window is up, until
+    # then the buttons show a blank image of the same size
+    self.blank_ico = tk.PhotoImage(width=32, height=32)
+    self.icons = []        # (widget, icon file) of the toolbar buttons
+
     self.open_btn = tk.Checkbutton(self.toolbar, indicatoron=0,
                                      overrelief=tk.GROOVE, offrelief=tk.FLAT,
                                      width=32, height=32,
-                                     image=self.open_ico,
+                                     image=self.blank_ico,
                                      variable=self.toggle_open)
+    self.icons.append((self.open_btn, 'open.png'))
 
-    self.clr_ico = ImageTk.PhotoImage(Image.open('clr.png'))
     self.clr_btn = tk.Button(self.toolbar, overrelief=tk.GROOVE, relief=tk.FLAT,
                              width=32, height=32,
-                             image=self.clr_ico)
+                             image=self.blank_ico)
+    self.icons.append((self.clr_btn, 'clr.png'))
 
-    self.cmd_ico = ImageTk.PhotoImage(Image.open('cmd.png'))
     self.cmd_btn = tk.Button(self.toolbar, overrelief=tk.GROOVE, relief=tk.FLAT,
                              width=32, height=32,
-                             image=self.cmd_ico)
+                             image=self.blank_ico)
+    self.icons.append((self.cmd_btn, 'cmd.png'))
 
 
-    self.btn = ({'img': ImageTk.PhotoImage(Image.open('ascii.png')), 'var': self.view_var,    'val': 'va_asc', },
-                {'img': ImageTk.PhotoImage(Image.open('hex.png')),   'var': self.view_var,    'val': 'va_hex', },
-                {'img': ImageTk.PhotoImage(Image.open('rep.png')),   'var': self.toggle_rep,                   },
-                {'img': ImageTk.PhotoImage(Image.open('xor.png')),   'var': self.toggle_xor,                   },
-                {'img': ImageTk.PhotoImage(Image.open('mod.png')),   'var': self.toggle_mod,                   },
-                {'img': ImageTk.PhotoImage(Image.open('echo.png')),  'var': self.toggle_echo,                  },
-                {'img': ImageTk.PhotoImage(Image.open('lf.png')),    'var': self.toggle_lf,                    },
-                {'img': ImageTk.PhotoImage(Image.open('cr.png')),    'var': self.toggle_cr,                    },
-                {'img': ImageTk.PhotoImage(Image.open('time.png')),  'var': self.toggle_time,                  })
+    self.btn = ({'ico': 'ascii.png', 'var': self.view_var,    'val': 'va_asc', },
+                {'ico': 'hex.png',   'var': self.view_var,    'val': 'va_hex', },
+                {'ico': 'rep.png',   'var': self.toggle_rep,                   },
+                {'ico': 'xor.png',   'var': self.toggle_xor,                   },
+                {'ico': 'mod.png',   'var': self.toggle_mod,                   },
+                {'ico': 'echo.png',  'var': self.toggle_echo,                  },
+                {'ico': 'lf.png',    'var': self.toggle_lf,                    },
+                {'ico': 'cr.png',    'var': self.toggle_cr,                    },
+                {'ico': 'time.png',  'var': self.toggle_time,                  })
 
     for b in self.btn:
       if 'cmd' in b:
         wgt = tk.Button(self.toolbar,
                              overrelief=tk.GROOVE, relief=tk.FLAT,
                              width=32, height=32,
-                             image=b['img'],
+                             image=self.blank_ico,
                              command=b['cmd'])
 
 
@@ -100,16 +262,17 @@ class TermView(ttk.tkinter.Tk):
         wgt = tk.Checkbutton(self.toolbar, indicatoron=0,
                                   overrelief=tk.GROOVE, offrelief=tk.FLAT,
                                   width=32, height=32,
-                                  image=b['img'],
+                                  image=self.blank_ico,
                                   variable=b['var'])
       else:
         wgt = tk.Radiobutton(self.toolbar, indicatoron=0,
                                   overrelief=tk.GROOVE, offrelief=tk.FLAT,
                                   width=32, height=32,
-                                  image=b['img'],
+                                  image=self.blank_ico,
                                   variable=b['var'],
                                   value=b['val'])
 
+      self.icons.append((wgt, b['ico']))
       wgt.pack(side=tk.RIGHT, padx=2, pady=2)
 
     self.open_btn.pack(side=tk.LEFT, padx=2, pady=2)
@@ -121,22 +284,67 @@ class TermView(ttk.tkinter.Tk):
                 'baud': ttk.Combobox(self.toolbar, textvariable=self.baud_set, values=[], width=8),
                 'bits': ttk.Combobox(self.toolbar, textvariable=self.bits_set, values=[], width=2),
                 'pary': ttk.Combobox(self.toolbar, textvariable=self.pary_set, values=[], width=2),
-                'stop': ttk.Combobox(self.toolbar, textvariable=self.stop_set, values=[], width=2)}
+                'stop': ttk.Combobox(self.toolbar, textvariable=self.stop_set, values=[], width=2),
+                'flow': ttk.Combobox(self.toolbar, textvariable=self.flow_set, values=[], width=8)}
 
-    for key in ['port', 'baud', 'bits', 'pary', 'stop']:
+    for key in ['port', 'baud', 'bits', 'pary', 'stop', 'flow']:
       self.cfg[key].pack(side=tk.LEFT, padx=2, pady=2)
 
+    # framing of the received data, not part of cfg so it can change while connected
+    self.frame_box = ttk.Combobox(self.toolbar, textvariable=self.frame_set, values=[], width=6, state='readonly')
+    self.frame_box.pack(side=tk.LEFT, padx=2, pady=2)
+
+    # checksum received frames must end with
+    self.check_box = ttk.Combobox(self.toolbar, textvariable=self.check_set, values=[], width=11, state='readonly')
+    self.check_box.pack(side=tk.LEFT, padx=2, pady=2)
+
+    # checksum appended to transmitted frames, mod and xor also have a toggle
+    self.sum_box = ttk.Combobox(self.toolbar, textvariable=self.sum_set, values=[], width=11, state='readonly')
+    self.sum_box.pack(side=tk.LEFT, padx=2, pady=2)
+
+    # resolution of the timestamps
+    self.res_box = ttk.Combobox(self.toolbar, textvariable=self.res_set, values=[], width=3, state='readonly')
+    self.res_box.pack(side=tk.LEFT, padx=2, pady=2)
+
+    # repeat rate [Hz], or max for line rate
+    self.rate_box = ttk.Combobox(self.toolbar, textvariable=self.rate_set, values=[], width=5)
+    self.rate_box.pack(side=tk.LEFT, padx=2, pady=2)
+
+    # shown while the update loop lags behind the receiver
+    self.busy_label = ttk.Label(self.toolbar, textvariable=self.busy_var, foreground='#c00000')
+    self.busy_label.pack(side=tk.LEFT, padx=6, pady=2)
+
     self.toolbar.pack(side=tk.TOP, fill=tk.X)
 
+    # search in the received stream
+    self.search_bar = ttk.Frame(self)
+    self.search_entry = ttk.Entry(self.search_bar, textvariable=self.search_var, width=40)
+    self.search_entry.pack(side=tk.LEFT, padx=2, pady=2)
+    self.search_box = ttk.Combobox(self.search_bar, textvariable=self.search_kind, values=[], width=6, state='readonly')
+    self.search_box.pack(side=tk.LEFT, padx=2, pady=2)
+    self.prev_btn = ttk.Button(self.search_bar, text='<', width=2)
+    self.prev_btn.pack(side=tk.LEFT, padx=2, pady=2)
+    self.next_btn = ttk.Button(self.search_bar, text='>', width=2)
+    self.next_btn.pack(side=tk.LEFT, padx=2, pady=2)
+    self.search_label = ttk.Label(self.search_bar, textvariable=self.search_info)
+    self.search_label.pack(side=tk.LEFT, padx=6, pady=2)
+    self.stats_btn = ttk.Checkbutton(self.search_bar, text='stats', variable=self.toggle_stats)
+    self.stats_btn.pack(side=tk.RIGHT, padx=2, pady=2)
+    self.search_bar.pack(side=tk.TOP, fill=tk.X)
+
     # font for the terminal window
-    text_font = font.Font(family="Courier", size=10)
+    text_font = self.text_font = font.Font(family="Courier", size=10)
 
     # use a frame to group the terminal window and scrollbar together
     output_frame = ttk.Frame(self, borderwidth=3, relief=tk.SUNKEN)
     output_frame.pack(side=tk.TOP, fill=tk.Y, expand=1)
 
+    # link statistics next to the terminal window, see show_stats()
+    self.stats_text = tk.Text(output_frame, width=44, height=24, takefocus=0, font=text_font,
+                              state='disabled', background='#f0f0f0')
+
     # create a vertical scrollbar
-    output_scroll = ttk.Scrollbar(output_frame)
+    output_scroll = self.output_scroll = ttk.Scrollbar(output_frame)
     output_scroll.pack(side=tk.RIGHT, fill=tk.Y, padx=2)
 
     # create a terminal window
@@ -147,10 +355,19 @@ class TermView(ttk.tkinter.Tk):
     self.output_text.tag_config('foreground_red', foreground="#ff0000")
     self.output_text.tag_config('foreground_grn', foreground="#00c000")
     self.output_text.tag_config('foreground_blk', foreground="#000000")
+    self.output_text.tag_config('foreground_bad', foreground="#000000", background="#ffc0c0")
+    self.output_text.tag_config('foreground_mon', foreground="#0000c0")
+    self.output_text.tag_config('match', background="#ffff00")
+
+    # connect the scrollbar to the scrollback instead of the text widget
+    output_scroll.config(command=self._on_yview)
+    for seq in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+      self.output_text.bind(seq, self._on_wheel)
+    self.output_text.bind('<Configure>', self._on_resize)
 
-    # connect the scrollbar
-    self.output_text.config(yscrollcommand=output_scroll.set)
-    output_scroll.config(command=self.output_text.yview)
+    # status bar with the runtime metrics
+    self.metrics_label = ttk.Label(self, textvariable=self.metrics_var, font=('Courier', 8))
+    self.metrics_label.pack(side=tk.BOTTOM, fill=tk.X, padx=2)
 
     # text entry
     self.entry = ttk.Entry(self, width=80, font=text_font)
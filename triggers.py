@@ -0,0 +1,160 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# triggers.py     auto-responder of Bt3
+#
+# Rules answer byte patterns in the received stream, for example an ACK
+# to a boot prompt. The Terminal feeds every chunk to its Responder from
+# the receiving thread as soon as the read returns, so a response goes
+# out without waiting for the GUI update loop.
+#
+
+import time
+import collections
+
+
+class Automaton(object):
+  """Automaton - Aho-Corasick matcher of many byte patterns at once.
+
+     The trie and its failure links are folded into a table of 256 next
+     states per state, scanning costs one lookup per byte. The state is
+     kept between feed() calls, so a pattern split over two chunks is
+     found as well.
+  """
+  def __init__(self, patterns):
+    goto = [{}]
+    out = [[]]
+    for n, pattern in enumerate(patterns):
+      s = 0
+      for b in pattern:
+        if b not in goto[s]:
+          goto[s][b] = len(goto)
+          goto.append({})
+          out.append([])
+        s = goto[s][b]
+      out[s].append(n)
+
+    # breadth first, the failure state of a state is always done before it
+    fail = [0] * len(goto)
+    delta = [None] * len(goto)
+    delta[0] = [goto[0].get(b, 0) for b in range(256)]
+    todo = collections.deque(goto[0].values())
+    for s in todo:
+      fail[s] = 0
+    while todo:
+      s = todo.popleft()
+      row = list(delta[fail[s]])
+      for b, t in goto[s].items():
+        if s:
+          fail[t] = delta[fail[s]][b]
+        row[b] = t
+        todo.append(t)
+      delta[s] = row
+      out[s] = out[s] + out[fail[s]]
+
+    self.delta = delta
+    self.out = [tuple(o) for o in out]
+    self.state = 0
+
+  def reset(self):
+    self.state = 0
+
+  def feed(self, data):
+    """Return [(end, pattern number)] of the matches ending in data, end is
+       the index just after the match."""
+    delta = self.delta
+    out = self.out
+    s = self.state
+    hits = []
+    for i, b in enumerate(data):
+      s = delta[s][b]
+      if out[s]:
+        hits.extend([(i + 1, n) for n in out[s]])
+    self.state = s
+    return hits
+
+
+class Rule(object):
+  """Rule - Sends response whenever pattern is received."""
+  def __init__(self, pattern, response, name=None, once=False):
+    self.pattern = pattern
+    self.response = response
+    self.name = name or repr(pattern)
+    self.once = once          # disable the rule after the first hit
+    self.enabled = True
+    self.hits = 0
+    self.latency_min = None   # ns from the read returning to the response written
+    self.latency_max = 0
+    self.latency_sum = 0
+
+  def hit(self, latency):
+    self.hits += 1
+    self.latency_sum += latency
+    self.latency_max = max(self.latency_max, latency)
+    self.latency_min = latency if self.latency_min is None else min(self.latency_min, latency)
+    if self.once:
+      self.enabled = False
+
+  def report(self):
+    if not self.hits:
+      return '%s: no hits' % self.name
+    return '%s: %d hits, latency %.3f/%.3f/%.3f ms min/avg/max' % (
+           self.name, self.hits, self.latency_min / 1e6, self.latency_sum / self.hits / 1e6,
+           self.latency_max / 1e6)
+
+
+class Responder(object):
+  """Responder - Answers the patterns of its rules in the received stream.
+
+     send(b) writes a response, Terminal.respond() skips the TX queue.
+     Rules can be added while receiving, the automaton is rebuilt and
+     swapped in as a whole.
+  """
+  def __init__(self, send):
+    self.send = send
+    self.rules = ()
+    self._compiled = ((), Automaton([]))
+
+  def add(self, pattern, response, name=None, once=False):
+    """Add a rule for the bytes pattern, returns the Rule."""
+    if not pattern:
+      raise ValueError('Empty trigger pattern.')
+    rule = Rule(bytes(pattern), bytes(response), name, once)
+    rules = self.rules + (rule,)
+    self._compiled = (rules, Automaton([r.pattern for r in rules]))
+    self.rules = rules
+    return rule
+
+  def reset(self):
+    # forget a partial match, e.g. on reconnect
+    self._compiled[1].reset()
+
+  def feed(self, data, t_ns):
+    """Answer the rules matching in chunk data, read at monotonic t_ns."""
+    rules, automaton = self._compiled
+    for _, n in automaton.feed(data):
+      rule = rules[n]
+      if rule.enabled:
+        self.send(rule.response)
+        rule.hit(time.monotonic_ns() - t_ns)
+
+  def report(self):
+    return '\n'.join([rule.report() for rule in self.rules])
@@ -0,0 +1,188 @@
+#  Copyright (c) 2016 DeKrijger Engineering
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+
+#
+# txwriter.py     transmit thread of the Bt3 serial port model
+#
+# Frames are queued by put() and written by a thread of its own, so a slow
+# device or a port held back by RTS/CTS or XON/XOFF flow control never
+# blocks the caller. The queue is bounded, a full queue pushes back: put()
+# either waits or returns False.
+#
+# A write error, e.g. an unplugged USB adapter, stops the writer: it is
+# reported to failed(), the queued frames are dropped and put() refuses
+# from then on, so no sender is left waiting on a queue nobody drains.
+#
+
+import time
+import queue
+import threading
+import collections
+
+import serial
+
+
+class TxWriter(object):
+  """TxWriter - Writes queued frames to a port.
+
+     Frames are written in slices of at most chunk bytes. char_gap seconds
+     between characters (which forces one character per write) and
+     frame_gap seconds between frames pace the output. written(b) is
+     called after each frame is out, failed(ex) when a write failed.
+  """
+  POLL = 0.1        # seconds a blocked put() waits before checking active
+
+  def __init__(self, port, written=None, maxsize=1024, chunk=256, char_gap=0.0, frame_gap=0.0, failed=None):
+    self.port = port
+    self.written = written
+    self.failed = failed
+    self.txQ = queue.Queue(maxsize)
+    self.chunk = chunk
+    self.char_gap = char_gap
+    self.frame_gap = frame_gap
+    self.active = False
+    self.thd = None
+    self.lock = threading.Lock()   # held while a frame is written, see urgent()
+    self.urgentQ = collections.deque()   # frames of urgent() waiting for the lock
+    self.frames = 0
+    self.bytes = 0
+    self.dropped = 0        # frames refused without waiting because the queue was full
+    self.error = None       # the exception that stopped the writer
+    self.blocked = 0.0      # seconds spent waiting inside port writes
+    self.started = 0.0
+
+  def start(self):
+    self.active = True
+    self.started = time.perf_counter()
+    self.thd = threading.Thread(target=self.run)
+    self.thd.daemon = True
+    self.thd.start()
+
+  def stop(self):
+    """Stop writing, frames still queued are dropped."""
+    self.active = False
+    self.port.cancel_write()
+    try:
+      self.txQ.put_nowait(None)
+    except queue.Full:
+      pass
+    if self.thd:
+      self.thd.join()
+
+  def put(self, b, block=False, timeout=None):
+    """Queue frame b, returns False when the queue stayed full or the
+       writer stopped. With block it waits up to timeout, None for as long
+       as the writer runs."""
+    end = None if timeout is None else time.monotonic() + timeout
+    while self.active:
+      try:
+        if not block:
+          self.txQ.put_nowait(b)
+        else:
+          wait = self.POLL if end is None else min(self.POLL, end - time.monotonic())
+          self.txQ.put(b, True, max(0.0, wait))
+        return True
+      except queue.Full:
+        if not block:
+          self.dropped += 1
+          return False
+        if end is not None and time.monotonic() >= end:
+          return False
+    return False
+
+  def urgent(self, b):
+    """Write frame b ahead of the queued frames, from the calling thread
+       when no frame is being written, otherwise the writer thread writes
+       it right after that frame. Never waits, a write error is reported
+       to failed() like one of the writer thread."""
+    if self.active:
+      self.urgentQ.append(b)
+      self._write_urgent()
+
+  def _write_urgent(self):
+    # whichever thread gets the lock writes the urgent frames, the other
+    # one leaves them. checked again after release, so none is left behind.
+    while self.urgentQ and self.lock.acquire(False):
+      try:
+        while self.urgentQ and self.active:
+          b = self.urgentQ.popleft()
+          self._write(b)
+          self.frames += 1
+          if self.written:
+            self.written(b)
+      except (serial.SerialException, OSError) as ex:
+        self._fail(ex)
+      finally:
+        self.lock.release()
+
+  @property
+  def depth(self):
+    return self.txQ.qsize()
+
+  def run(self):
+    while self.active:
+      b = self.txQ.get()
+      if b is None or not self.active:
+        break
+      try:
+        with self.lock:
+          self._write(b)
+          self.frames += 1
+      except (serial.SerialException, OSError) as ex:
+        self._fail(ex)
+        break
+      if self.written:
+        self.written(b)
+      self._write_urgent()
+      if self.frame_gap:
+        time.sleep(self.frame_gap)
+
+  def _fail(self, ex):
+    # stop accepting frames and drop the queued ones, a sender blocked in
+    # put() gives up within POLL
+    was_active = self.active
+    self.active = False
+    self.error = ex
+    try:
+      while True:
+        self.txQ.get_nowait()
+    except queue.Empty:
+      pass
+    self.urgentQ.clear()
+    if was_active and self.failed:
+      self.failed(ex)
+
+  def _write(self, b):
+    step = 1 if self.char_gap else self.chunk
+    view = memoryview(b)
+    for i in range(0, len(b), step):
+      t0 = time.perf_counter()
+      self.port.write(view[i:i + step])
+      self.blocked += time.perf_counter() - t0
+      self.bytes += len(view[i:i + step])
+      if not self.active:
+        break
+      if self.char_gap:
+        time.sleep(self.char_gap)
+
+  def report(self):
+    elapsed = max(1e-9, time.perf_counter() - self.started)
+    return 'TX %d frames, %d bytes, %.0f B/s, %.3f s blocked, %d dropped' % (
+           self.frames, self.bytes, self.bytes / elapsed, self.blocked, self.dropped)